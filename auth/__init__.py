@@ -0,0 +1,34 @@
+__all__ = (
+    'AuthSettings',
+    'BloomFilter',
+    'auth_settings',
+    'CompiledPolicy',
+    'KeyRing',
+    'KeySetError',
+    'PolicyEngine',
+    'PolicyError',
+    'PasswordHasher',
+    'LoginRateLimiter',
+    'Principal',
+    'RateLimited',
+    'RefreshTokenError',
+    'RefreshTokenStore',
+    'RevocationList',
+    'SharedRefreshTokenStore',
+    'SharedRevocationList',
+    'TokenCache',
+    'build_crypt_context',
+    'compile_policy',
+    'pick_cost',
+    'route_key',
+)
+
+from auth.config import AuthSettings, auth_settings
+from auth.hashing import PasswordHasher, build_crypt_context, pick_cost
+from auth.keys import KeyRing, KeySetError
+from auth.policy import CompiledPolicy, PolicyEngine, PolicyError, compile_policy, route_key
+from auth.principal import Principal
+from auth.rate_limit import LoginRateLimiter, RateLimited
+from auth.refresh import RefreshTokenError, RefreshTokenStore, SharedRefreshTokenStore
+from auth.revocation import BloomFilter, RevocationList, SharedRevocationList
+from auth.token_cache import TokenCache
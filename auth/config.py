@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+dotenv_path = Path(__file__).parent.parent / '.env'
+
+load_dotenv(dotenv_path=dotenv_path)
+
+
+class AuthSettings:
+    # схема хеширования паролей: bcrypt или argon2 (нужен пакет argon2-cffi);
+    # хеши со старой схемой или другой стоимостью пересчитываются при успешном логине
+    PWD_SCHEME = os.getenv('PWD_SCHEME', 'bcrypt')
+    PWD_BCRYPT_ROUNDS = int(os.getenv('PWD_BCRYPT_ROUNDS', 12))
+    PWD_ARGON2_TIME_COST = int(os.getenv('PWD_ARGON2_TIME_COST', 3))
+    PWD_ARGON2_MEMORY_COST = int(os.getenv('PWD_ARGON2_MEMORY_COST', 65536))  # KiB
+    PWD_ARGON2_PARALLELISM = int(os.getenv('PWD_ARGON2_PARALLELISM', 4))
+
+    # пул для bcrypt: thread (по умолчанию) или process
+    PWD_HASH_EXECUTOR = os.getenv('PWD_HASH_EXECUTOR', 'thread')
+    PWD_HASH_WORKERS = int(os.getenv('PWD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+    # сколько задач может ждать свободного воркера, сверх этого - 503
+    PWD_HASH_QUEUE = int(os.getenv('PWD_HASH_QUEUE', 32))
+
+    # короткоживущий access-токен и долгоживущий refresh-токен для его обновления без пароля
+    ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv('ACCESS_TOKEN_EXPIRE_MINUTES', 10))
+    REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv('REFRESH_TOKEN_EXPIRE_DAYS', 7))
+    REFRESH_TOKEN_STORE_SIZE = int(os.getenv('REFRESH_TOKEN_STORE_SIZE', 100_000))
+
+    # где хранятся refresh-токены, отозванные access-токены и лимиты логина: memory - в памяти процесса
+    # (только для одного воркера), redis - общий для всех воркеров бэкенд cache.SharedBackend (CACHE_URL)
+    AUTH_STATE_BACKEND = os.getenv('AUTH_STATE_BACKEND', 'memory')
+
+    # максимум одновременно отозванных (и еще не истекших) access-токенов, только для AUTH_STATE_BACKEND=memory
+    REVOCATION_CAPACITY = int(os.getenv('REVOCATION_CAPACITY', 100_000))
+
+    # лимиты попыток логина: запросов в минуту и размер всплеска, отдельно на username и на IP
+    LOGIN_USER_PER_MINUTE = float(os.getenv('LOGIN_USER_PER_MINUTE', 10))
+    LOGIN_USER_BURST = int(os.getenv('LOGIN_USER_BURST', 5))
+    LOGIN_IP_PER_MINUTE = float(os.getenv('LOGIN_IP_PER_MINUTE', 60))
+    LOGIN_IP_BURST = int(os.getenv('LOGIN_IP_BURST', 20))
+    # после LOGIN_LOCKOUT_THRESHOLD неудач подряд username блокируется, время блокировки удваивается
+    LOGIN_LOCKOUT_THRESHOLD = int(os.getenv('LOGIN_LOCKOUT_THRESHOLD', 5))
+    LOGIN_LOCKOUT_BASE_SECONDS = float(os.getenv('LOGIN_LOCKOUT_BASE_SECONDS', 30))
+    LOGIN_LOCKOUT_MAX_SECONDS = float(os.getenv('LOGIN_LOCKOUT_MAX_SECONDS', 3600))
+    # memory - в процессе (LRU на LOGIN_LIMITER_MAX_KEYS ключей), redis - общий для всех воркеров (CACHE_URL)
+    LOGIN_LIMITER_BACKEND = os.getenv('LOGIN_LIMITER_BACKEND', AUTH_STATE_BACKEND)
+    LOGIN_LIMITER_MAX_KEYS = int(os.getenv('LOGIN_LIMITER_MAX_KEYS', 100_000))
+
+    # размер LRU-кеша проверенных JWT, 0 - кеш выключен
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 10_000))
+
+    # файл RBAC-политики и период проверки его изменений (0 - без горячей перезагрузки)
+    RBAC_POLICY_FILE = os.getenv('RBAC_POLICY_FILE', str(Path(__file__).parent.parent / 'policy.json'))
+    RBAC_POLICY_RELOAD_INTERVAL = float(os.getenv('RBAC_POLICY_RELOAD_INTERVAL', 5))
+
+    # symmetric - HS256 с общим секретом; asymmetric - RS256/ES256 ключи из JWT_KEYS_DIR (keyset.json + PEM)
+    JWT_MODE = os.getenv('JWT_MODE', 'symmetric')
+    JWT_KEYS_DIR = os.getenv('JWT_KEYS_DIR', str(Path(__file__).parent.parent / 'keys'))
+    JWT_KEYS_REFRESH_INTERVAL = float(os.getenv('JWT_KEYS_REFRESH_INTERVAL', 30))
+
+
+auth_settings = AuthSettings()
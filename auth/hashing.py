@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+from passlib.context import CryptContext
+
+from exceptions import hasher_overloaded_exc
+from metrics import observe_phase
+
+
+# В процессном пуле CryptContext не передается между процессами, поэтому передаем его конфиг строкой
+# и собираем контекст в воркере один раз.
+@lru_cache(maxsize=8)
+def _context_from_config(config: str) -> CryptContext:
+    return CryptContext.from_string(config)
+
+
+def _timed_verify(config: str, plain_password: str, hashed_password: str) -> tuple[bool, float]:
+    started = time.perf_counter()
+    result = _context_from_config(config).verify(plain_password, hashed_password)
+    return result, time.perf_counter() - started
+
+
+def _timed_verify_and_update(config: str, plain_password: str,
+                             hashed_password: str) -> tuple[tuple[bool, str | None], float]:
+    started = time.perf_counter()
+    result = _context_from_config(config).verify_and_update(plain_password, hashed_password)
+    return result, time.perf_counter() - started
+
+
+def _timed_hash(config: str, password: str) -> tuple[str, float]:
+    started = time.perf_counter()
+    result = _context_from_config(config).hash(password)
+    return result, time.perf_counter() - started
+
+
+class HashingStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.wait_seconds = 0.0
+        self.hash_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe(self, wait: float, work: float):
+        with self._lock:
+            self.completed += 1
+            self.wait_seconds += wait
+            self.hash_seconds += work
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def rehash(self):
+        with self._lock:
+            self.rehashed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'rehashed': self.rehashed,
+                'wait_seconds_total': self.wait_seconds,
+                'hash_seconds_total': self.hash_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+            }
+
+
+# Основная схема - scheme, остальные поддерживаемые схемы остаются для проверки старых хешей
+# и помечаются устаревшими. Стоимость зафиксирована (min = max = default), поэтому хеш с другой
+# стоимостью тоже считается устаревшим и пересчитывается.
+def build_crypt_context(scheme: str = 'bcrypt', bcrypt_rounds: int = 12, argon2_time_cost: int = 3,
+                        argon2_memory_cost: int = 65536, argon2_parallelism: int = 4) -> CryptContext:
+    if scheme not in ('bcrypt', 'argon2'):
+        raise ValueError(f'Unknown password hashing scheme: {scheme}')
+    schemes = [scheme] + [other for other in ('bcrypt', 'argon2') if other != scheme]
+    if scheme == 'bcrypt':
+        # argon2-хеши проверяются, только если установлен argon2-cffi
+        try:
+            import argon2  # noqa: F401
+        except ImportError:
+            schemes = ['bcrypt']
+    return CryptContext(
+        schemes=schemes,
+        deprecated='auto',
+        bcrypt__default_rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+
+# Подбирает максимальную стоимость, при которой проверка пароля укладывается в target_ms на этом железе.
+# Для bcrypt меняется число раундов, для argon2 - time_cost при заданной памяти.
+def pick_cost(target_ms: float, scheme: str = 'bcrypt', argon2_memory_cost: int = 65536,
+              argon2_parallelism: int = 4, samples: int = 3) -> dict:
+    def verify_ms(context: CryptContext) -> float:
+        hashed = context.hash('benchmark-password')
+        best = float('inf')
+        for _ in range(samples):
+            started = time.perf_counter()
+            context.verify('benchmark-password', hashed)
+            best = min(best, (time.perf_counter() - started) * 1000)
+        return best
+
+    if scheme == 'bcrypt':
+        candidates = range(4, 20)
+        make = lambda cost: build_crypt_context('bcrypt', bcrypt_rounds=cost)
+        param = 'bcrypt_rounds'
+    elif scheme == 'argon2':
+        candidates = range(1, 20)
+        make = lambda cost: build_crypt_context('argon2', argon2_time_cost=cost, argon2_memory_cost=argon2_memory_cost,
+                                                argon2_parallelism=argon2_parallelism)
+        param = 'argon2_time_cost'
+    else:
+        raise ValueError(f'Unknown password hashing scheme: {scheme}')
+
+    chosen, chosen_ms = candidates[0], None
+    for cost in candidates:
+        elapsed = verify_ms(make(cost))
+        if elapsed > target_ms and chosen_ms is not None:
+            break
+        chosen, chosen_ms = cost, elapsed
+        if elapsed > target_ms:
+            break
+    return {'scheme': scheme, param: chosen, 'verify_ms': chosen_ms}
+
+
+# bcrypt выполняется в отдельном ограниченном пуле, чтобы не блокировать event loop
+class PasswordHasher:
+
+    def __init__(self, context: CryptContext, max_workers: int = 4, max_queue: int = 32, executor: str = 'thread'):
+        if executor not in ('thread', 'process'):
+            raise ValueError(f'Unknown executor type: {executor}')
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor_type = executor
+        self.stats = HashingStats()
+        self._config = context.to_string()
+        self._executor: Executor | None = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='pwd-hash')
+        return self._executor
+
+    async def _submit(self, func, *args):
+        # backpressure: воркеры заняты и очередь заполнена - сразу отвечаем 503
+        if self._pending >= self.max_workers + self.max_queue:
+            self.stats.reject()
+            raise hasher_overloaded_exc
+        self._pending += 1
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, work = await loop.run_in_executor(self._get_executor(), func, self._config, *args)
+        finally:
+            self._pending -= 1
+        wait = max(time.perf_counter() - submitted - work, 0.0)
+        self.stats.observe(wait=wait, work=work)
+        observe_phase('password_queue_wait', wait)
+        observe_phase('password_hash', work)
+        return result
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(_timed_verify, plain_password, hashed_password)
+
+    # возвращает (верный ли пароль, новый хеш или None, если пересчет не нужен)
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+        verified, new_hash = await self._submit(_timed_verify_and_update, plain_password, hashed_password)
+        if new_hash is not None:
+            self.stats.rehash()
+        return verified, new_hash
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(_timed_hash, password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
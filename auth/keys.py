@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from jose import JWTError, jwk, jwt
+
+logger = logging.getLogger(__name__)
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'RS384', 'RS512', 'ES256', 'ES384', 'ES512')
+
+
+class KeySetError(ValueError):
+    pass
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+# Один ключ из набора. Объекты ключей строятся один раз при загрузке, на запросе PEM не парсится.
+class SigningKey:
+    __slots__ = ('kid', 'alg', 'private_key', 'public_key', 'activate_at', 'retire_at', 'jwk')
+
+    def __init__(self, kid: str, alg: str, public_pem: str, private_pem: str | None = None,
+                 activate_at: datetime | None = None, retire_at: datetime | None = None):
+        if alg not in ASYMMETRIC_ALGORITHMS:
+            raise KeySetError(f'Unsupported algorithm {alg!r} for key {kid!r}')
+        self.kid = kid
+        self.alg = alg
+        self.public_key = jwk.construct(public_pem, alg)
+        self.private_key = jwk.construct(private_pem, alg) if private_pem else None
+        self.activate_at = activate_at
+        self.retire_at = retire_at
+        self.jwk = {**self.public_key.to_dict(), 'kid': kid, 'use': 'sig'}
+
+    def can_sign(self, now: datetime) -> bool:
+        return (self.private_key is not None
+                and (self.activate_at is None or self.activate_at <= now)
+                and (self.retire_at is None or now < self.retire_at))
+
+    # после вывода из ротации ключ еще принимается, пока не истекут выпущенные им токены
+    def can_verify(self, now: datetime, token_lifetime: timedelta) -> bool:
+        return self.retire_at is None or now < self.retire_at + token_lifetime
+
+
+# Неизменяемый снимок набора ключей на момент времени: ключ подписи и ключи проверки по kid
+class KeySnapshot:
+    __slots__ = ('signing_key', 'verify_keys', 'algorithms', 'jwks')
+
+    def __init__(self, keys: list[SigningKey], now: datetime, token_lifetime: timedelta):
+        signers = [key for key in keys if key.can_sign(now)]
+        # активным считается самый поздно активированный ключ
+        self.signing_key = max(signers, key=lambda k: k.activate_at or datetime.min.replace(tzinfo=timezone.utc),
+                               default=None)
+        self.verify_keys = {key.kid: key for key in keys if key.can_verify(now, token_lifetime)}
+        self.algorithms = {kid: [key.alg] for kid, key in self.verify_keys.items()}
+        self.jwks = {'keys': [key.jwk for key in self.verify_keys.values()]}
+
+
+def load_keys(directory: Path) -> list[SigningKey]:
+    manifest = directory / 'keyset.json'
+    with manifest.open(encoding='utf-8') as f:
+        data = json.load(f)
+    keys = []
+    for item in data.get('keys', []):
+        private_file = item.get('private')
+        private_path = directory / private_file if private_file else None
+        keys.append(SigningKey(
+            kid=item['kid'],
+            alg=item.get('alg', 'RS256'),
+            public_pem=(directory / item['public']).read_text(),
+            # у верифицирующих воркеров приватных ключей нет - это нормально
+            private_pem=private_path.read_text() if private_path and private_path.exists() else None,
+            activate_at=_parse_time(item.get('activate_at')),
+            retire_at=_parse_time(item.get('retire_at')),
+        ))
+    return keys
+
+
+# Набор ключей из каталога с keyset.json. refresh() перечитывает манифест при изменении
+# и пересчитывает активный ключ по расписанию activate_at/retire_at.
+class KeyRing:
+    def __init__(self, directory: str | Path, token_lifetime: timedelta):
+        self.directory = Path(directory)
+        self.token_lifetime = token_lifetime
+        self._lock = threading.Lock()
+        self._mtime = self._manifest_mtime()
+        self._keys = load_keys(self.directory)
+        self._snapshot = KeySnapshot(self._keys, datetime.now(timezone.utc), token_lifetime)
+
+    def _manifest_mtime(self) -> float:
+        return (self.directory / 'keyset.json').stat().st_mtime
+
+    @property
+    def snapshot(self) -> KeySnapshot:
+        return self._snapshot
+
+    @property
+    def jwks(self) -> dict:
+        return self._snapshot.jwks
+
+    def encode(self, claims: dict) -> str:
+        signing_key = self._snapshot.signing_key
+        if signing_key is None:
+            raise KeySetError('No active signing key in key set')
+        return jwt.encode(claims, signing_key.private_key, algorithm=signing_key.alg,
+                          headers={'kid': signing_key.kid})
+
+    def decode(self, token: str) -> dict:
+        snapshot = self._snapshot
+        kid = jwt.get_unverified_header(token).get('kid')
+        key = snapshot.verify_keys.get(kid)
+        if key is None:
+            raise JWTError(f'Unknown key id: {kid}')
+        return jwt.decode(token, key.public_key, algorithms=snapshot.algorithms[kid])
+
+    def refresh(self) -> bool:
+        with self._lock:
+            try:
+                mtime = self._manifest_mtime()
+                if mtime != self._mtime:
+                    self._keys = load_keys(self.directory)
+                    self._mtime = mtime
+                    logger.info('JWT key set reloaded from %s', self.directory)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error('Failed to reload JWT key set from %s: %s', self.directory, e)
+            snapshot = KeySnapshot(self._keys, datetime.now(timezone.utc), self.token_lifetime)
+            changed = (snapshot.signing_key is not self._snapshot.signing_key
+                       or snapshot.verify_keys.keys() != self._snapshot.verify_keys.keys())
+            self._snapshot = snapshot
+            return changed
+
+    async def watch(self, interval: float = 30.0):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.refresh)
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import threading
+from pathlib import Path
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+class PolicyError(ValueError):
+    pass
+
+
+# Скомпилированная политика: каждое разрешение - один бит, роль и роут - маски из этих битов.
+# Объект неизменяемый, при перезагрузке создается новый и подменяется целиком.
+class CompiledPolicy:
+    __slots__ = ('permission_bits', 'role_masks', 'route_masks', 'version')
+
+    def __init__(self, permission_bits: dict[str, int], role_masks: dict[str, int], route_masks: dict[str, int],
+                 version: float = 0.0):
+        self.permission_bits = MappingProxyType(permission_bits)
+        self.role_masks = MappingProxyType(role_masks)
+        self.route_masks = MappingProxyType(route_masks)
+        self.version = version
+
+    def mask_for(self, *permissions: str) -> int:
+        mask = 0
+        for permission in permissions:
+            try:
+                mask |= self.permission_bits[permission]
+            except KeyError:
+                raise PolicyError(f'Unknown permission: {permission}') from None
+        return mask
+
+    def role_mask(self, role: str) -> int:
+        return self.role_masks.get(role, 0)
+
+    def allows(self, role: str, required: int) -> bool:
+        return self.role_masks.get(role, 0) & required == required
+
+    def route_table(self) -> dict[str, int]:
+        return dict(self.route_masks)
+
+
+def compile_policy(data: dict, version: float = 0.0) -> CompiledPolicy:
+    permission_bits = {name: 1 << i for i, name in enumerate(data.get('permissions', []))}
+    roles = data.get('roles', {})
+
+    def permissions_mask(names, where) -> int:
+        mask = 0
+        for name in names:
+            if name not in permission_bits:
+                raise PolicyError(f'Unknown permission {name!r} in {where}')
+            mask |= permission_bits[name]
+        return mask
+
+    role_masks: dict[str, int] = {}
+
+    def resolve(role: str, stack: tuple[str, ...]) -> int:
+        if role in role_masks:
+            return role_masks[role]
+        if role in stack:
+            raise PolicyError(f'Role inheritance cycle: {" -> ".join(stack + (role,))}')
+        if role not in roles:
+            raise PolicyError(f'Unknown role: {role}')
+        spec = roles[role]
+        mask = permissions_mask(spec.get('permissions', []), f'role {role!r}')
+        for parent in spec.get('inherits', []):
+            mask |= resolve(parent, stack + (role,))
+        role_masks[role] = mask
+        return mask
+
+    for role in roles:
+        resolve(role, ())
+
+    route_masks = {
+        route: permissions_mask(permissions, f'route {route!r}')
+        for route, permissions in data.get('routes', {}).items()
+    }
+    return CompiledPolicy(permission_bits, role_masks, route_masks, version)
+
+
+def load_policy(path: str | Path) -> CompiledPolicy:
+    path = Path(path)
+    with path.open(encoding='utf-8') as f:
+        data = json.load(f)
+    return compile_policy(data, version=path.stat().st_mtime)
+
+
+def route_key(method: str, path: str) -> str:
+    return f'{method.upper()} {path}'
+
+
+# Держит текущую политику и перечитывает файл при его изменении. Подмена ссылки атомарна,
+# поэтому запросы всегда видят либо старую, либо новую политику целиком.
+class PolicyEngine:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._policy = load_policy(self.path)
+        self._reload_lock = threading.Lock()
+
+    @property
+    def policy(self) -> CompiledPolicy:
+        return self._policy
+
+    def route_mask(self, method: str, path: str) -> int | None:
+        return self._policy.route_masks.get(route_key(method, path))
+
+    def reload(self) -> bool:
+        with self._reload_lock:
+            try:
+                mtime = self.path.stat().st_mtime
+                if mtime == self._policy.version:
+                    return False
+                new_policy = load_policy(self.path)
+            except (OSError, ValueError) as e:
+                # битый файл не должен ронять сервис - остаемся на предыдущей версии
+                logger.error('Failed to reload RBAC policy from %s: %s', self.path, e)
+                return False
+            self._policy = new_policy
+            logger.info('RBAC policy reloaded from %s', self.path)
+            return True
+
+    async def watch(self, interval: float = 5.0):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.reload)
@@ -0,0 +1,13 @@
+# Пользователь, от имени которого выполняется запрос. Создается один раз на запрос
+# и кладется в request.state, чтобы зависимости и обработчики не искали пользователя повторно.
+class Principal:
+    __slots__ = ('user', 'username', 'role', 'disabled')
+
+    def __init__(self, user):
+        self.user = user
+        self.username = user.username
+        self.role = user.role
+        self.disabled = bool(user.disabled)
+
+    def __repr__(self):
+        return f'Principal(username={self.username!r}, role={self.role!r})'
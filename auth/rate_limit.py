@@ -0,0 +1,71 @@
+import math
+import time
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f'Rate limited, retry after {retry_after:.0f}s')
+        self.retry_after = retry_after
+
+
+# Ограничение попыток логина до проверки пароля: token bucket по username и по IP клиента
+# плюс прогрессивная блокировка username после серии неудачных попыток.
+# Состояние хранится в бэкенде из пакета cache: MemoryBackend (LRU, ограничен по размеру) или общий SharedBackend.
+class LoginRateLimiter:
+    def __init__(self, store, user_rate: float, user_burst: int, ip_rate: float, ip_burst: int,
+                 lockout_threshold: int = 5, lockout_base: float = 30, lockout_max: float = 3600):
+        self.store = store
+        # rate - токенов в секунду
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.lockout_threshold = lockout_threshold
+        self.lockout_base = lockout_base
+        self.lockout_max = lockout_max
+        self.rejected = 0
+
+    async def _take(self, key: str, rate: float, burst: int, now: float) -> float:
+        state = await self.store.get(key)
+        if state is None:
+            tokens = float(burst)
+        else:
+            tokens = min(float(burst), state['tokens'] + (now - state['ts']) * rate)
+        if tokens < 1:
+            return (1 - tokens) / rate
+        # запись живет, пока ведро не наполнится снова
+        await self.store.set(key, {'tokens': tokens - 1, 'ts': now}, ttl=burst / rate + 1)
+        return 0.0
+
+    async def check(self, username: str, client_ip: str | None):
+        now = time.time()
+        lockout = await self.store.get(f'login:lock:{username}')
+        if lockout is not None and lockout['until'] > now:
+            self.rejected += 1
+            raise RateLimited(lockout['until'] - now)
+        if client_ip is not None:
+            retry_after = await self._take(f'login:ip:{client_ip}', self.ip_rate, self.ip_burst, now)
+            if retry_after:
+                self.rejected += 1
+                raise RateLimited(retry_after)
+        retry_after = await self._take(f'login:user:{username}', self.user_rate, self.user_burst, now)
+        if retry_after:
+            self.rejected += 1
+            raise RateLimited(retry_after)
+
+    async def register_failure(self, username: str):
+        now = time.time()
+        key = f'login:fail:{username}'
+        failures = (await self.store.get(key) or 0) + 1
+        await self.store.set(key, failures, ttl=self.lockout_max)
+        if failures >= self.lockout_threshold:
+            # каждая следующая неудача удваивает блокировку
+            duration = min(self.lockout_base * 2 ** (failures - self.lockout_threshold), self.lockout_max)
+            await self.store.set(f'login:lock:{username}', {'until': now + duration}, ttl=math.ceil(duration))
+
+    async def register_success(self, username: str):
+        await self.store.delete(f'login:fail:{username}')
+        await self.store.delete(f'login:lock:{username}')
+
+    def stats(self) -> dict:
+        return {'rejected': self.rejected}
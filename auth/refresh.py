@@ -0,0 +1,159 @@
+import hashlib
+import secrets
+import threading
+import time
+
+
+class RefreshTokenError(Exception):
+    pass
+
+
+class _RefreshRecord:
+    __slots__ = ('username', 'family', 'expires_at', 'used')
+
+    def __init__(self, username: str, family: bytes, expires_at: float):
+        self.username = username
+        self.family = family
+        self.expires_at = expires_at
+        self.used = False
+
+
+def _digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
+# Хранилище refresh-токенов в памяти процесса. Сами токены не хранятся - только sha256 (32 байта).
+# Каждый токен одноразовый: при обмене выдается новый в том же "семействе". Повторное предъявление
+# уже использованного токена означает утечку - отзывается все семейство.
+# Все проверки - поиск в dict, O(1).
+class RefreshTokenStore:
+    def __init__(self, ttl_seconds: float, max_size: int = 100_000):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._tokens: dict[bytes, _RefreshRecord] = {}
+        self._revoked_families: dict[bytes, float] = {}
+        self._user_families: dict[str, set[bytes]] = {}
+        self._lock = threading.Lock()
+        self._next_cleanup = time.monotonic() + 60
+
+    def __len__(self):
+        return len(self._tokens)
+
+    async def issue(self, username: str, family: bytes | None = None) -> str:
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        with self._lock:
+            self._maybe_cleanup(now)
+            if len(self._tokens) >= self.max_size:
+                self._evict_oldest()
+            family = family or secrets.token_bytes(16)
+            self._tokens[_digest(token)] = _RefreshRecord(username, family, now + self.ttl_seconds)
+            self._user_families.setdefault(username, set()).add(family)
+        return token
+
+    # возвращает имя пользователя и новый refresh-токен взамен предъявленного
+    async def rotate(self, token: str) -> tuple[str, str]:
+        now = time.time()
+        with self._lock:
+            record = self._tokens.get(_digest(token))
+            if record is None or record.expires_at <= now or record.family in self._revoked_families:
+                raise RefreshTokenError('Invalid refresh token')
+            if record.used:
+                self._revoke_family(record.family, record.expires_at)
+                raise RefreshTokenError('Refresh token reuse detected')
+            record.used = True
+            username, family = record.username, record.family
+        return username, await self.issue(username, family)
+
+    async def revoke(self, token: str) -> bool:
+        with self._lock:
+            record = self._tokens.get(_digest(token))
+            if record is None:
+                return False
+            self._revoke_family(record.family, time.time() + self.ttl_seconds)
+            return True
+
+    async def revoke_user(self, username: str):
+        with self._lock:
+            for family in self._user_families.pop(username, set()):
+                self._revoked_families[family] = time.time() + self.ttl_seconds
+
+    def _revoke_family(self, family: bytes, until: float):
+        self._revoked_families[family] = max(until, self._revoked_families.get(family, 0))
+
+    def _maybe_cleanup(self, now: float):
+        if time.monotonic() < self._next_cleanup:
+            return
+        self._next_cleanup = time.monotonic() + 60
+        expired = [key for key, record in self._tokens.items() if record.expires_at <= now]
+        for key in expired:
+            del self._tokens[key]
+        self._revoked_families = {f: until for f, until in self._revoked_families.items() if until > now}
+        live_families = {record.family for record in self._tokens.values()}
+        for username in list(self._user_families):
+            families = self._user_families[username] & live_families
+            if families:
+                self._user_families[username] = families
+            else:
+                del self._user_families[username]
+
+    def _evict_oldest(self):
+        # dict сохраняет порядок вставки - первым идет самый старый токен
+        oldest = next(iter(self._tokens))
+        del self._tokens[oldest]
+
+
+# То же в общем бэкенде (cache.SharedBackend), чтобы обмен и отзыв работали в любом воркере.
+# Ключи: refresh:token:<sha256> - запись токена, refresh:used:<sha256> - след уже обмененного токена
+# (для обнаружения повторного предъявления), refresh:family:<id> - отозванное семейство,
+# refresh:user:<username> - время, до которого отозваны все токены пользователя. Все ключи живут не дольше ttl.
+class SharedRefreshTokenStore:
+    def __init__(self, store, ttl_seconds: float):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+
+    async def issue(self, username: str, family: str | None = None) -> str:
+        token = secrets.token_urlsafe(32)
+        now = time.time()
+        record = {'username': username, 'family': family or secrets.token_urlsafe(16), 'issued_at': now,
+                  'expires_at': now + self.ttl_seconds}
+        await self.store.set(f'refresh:token:{_digest(token).hex()}', record, ttl=self.ttl_seconds)
+        return token
+
+    async def rotate(self, token: str) -> tuple[str, str]:
+        key = _digest(token).hex()
+        # pop атомарен: из двух одновременных обменов одного токена успешен только один
+        record = await self.store.pop(f'refresh:token:{key}')
+        if record is None:
+            used = await self.store.get(f'refresh:used:{key}')
+            if used is not None:
+                await self._revoke_family(used['family'])
+                raise RefreshTokenError('Refresh token reuse detected')
+            raise RefreshTokenError('Invalid refresh token')
+        remaining = record['expires_at'] - time.time()
+        if remaining <= 0:
+            raise RefreshTokenError('Invalid refresh token')
+        await self.store.set(f'refresh:used:{key}', record, ttl=remaining)
+        if await self._is_revoked(record):
+            raise RefreshTokenError('Invalid refresh token')
+        return record['username'], await self.issue(record['username'], record['family'])
+
+    async def revoke(self, token: str) -> bool:
+        key = _digest(token).hex()
+        record = await self.store.get(f'refresh:token:{key}') or await self.store.get(f'refresh:used:{key}')
+        if record is None:
+            return False
+        await self._revoke_family(record['family'])
+        return True
+
+    async def revoke_user(self, username: str):
+        await self.store.set(f'refresh:user:{username}', time.time(), ttl=self.ttl_seconds)
+
+    async def _revoke_family(self, family: str):
+        await self.store.set(f'refresh:family:{family}', True, ttl=self.ttl_seconds)
+
+    async def _is_revoked(self, record: dict) -> bool:
+        if await self.store.get(f'refresh:family:{record["family"]}') is not None:
+            return True
+        revoked_before = await self.store.get(f'refresh:user:{record["username"]}')
+        return revoked_before is not None and record['issued_at'] <= revoked_before
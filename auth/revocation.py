@@ -0,0 +1,148 @@
+import hashlib
+import heapq
+import math
+import threading
+import time
+
+
+# Bloom-фильтр: "точно нет" за несколько операций с битами, "возможно да" проверяется по точному набору.
+# Удалять из него нельзя, поэтому при очистке просроченных записей он перестраивается заново.
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+# Список отозванных токенов по jti в памяти процесса. Запись живет до exp токена - после этого токен и так невалиден.
+class RevocationList:
+    def __init__(self, capacity: int = 100_000, error_rate: float = 0.001, cleanup_interval: float = 60):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.cleanup_interval = cleanup_interval
+        self._revoked: dict[str, float] = {}
+        # (exp, jti) - куча по времени истечения: и просроченные, и вытесняемые записи снимаются с вершины
+        self._expiry: list[tuple[float, str]] = []
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+        self._next_cleanup = time.monotonic() + cleanup_interval
+        self.bloom_negatives = 0
+        self.false_positives = 0
+        # записей, удаленных из словаря, но еще оставивших биты в фильтре
+        self._stale = 0
+        # до этого времени в фильтре могут быть биты вытесненных при переполнении, но еще не истекших jti
+        self._overflow_until = 0.0
+        self.evicted = 0
+        self.overflow_hits = 0
+
+    def __len__(self):
+        return len(self._revoked)
+
+    async def revoke(self, jti: str, exp: float):
+        now = time.time()
+        if exp <= now:
+            return
+        with self._lock:
+            if jti in self._revoked:
+                return
+            if time.monotonic() >= self._next_cleanup:
+                self._cleanup(now)
+            if len(self._revoked) >= self.capacity:
+                # лимит памяти: вытесняем запись, которая истекает раньше всех. Ее биты остаются в фильтре,
+                # и до ее exp попадание в фильтр считается отзывом (fail closed), см. is_revoked
+                earliest_exp, earliest = heapq.heappop(self._expiry)
+                del self._revoked[earliest]
+                self._overflow_until = max(self._overflow_until, earliest_exp)
+                self._stale += 1
+                self.evicted += 1
+            self._revoked[jti] = exp
+            heapq.heappush(self._expiry, (exp, jti))
+            self._bloom.add(jti)
+
+    async def is_revoked(self, jti: str | None) -> bool:
+        if jti is None:
+            return False
+        if jti not in self._bloom:
+            self.bloom_negatives += 1
+            return False
+        exp = self._revoked.get(jti)
+        if exp is None:
+            # токен мог быть вытеснен при переполнении: отличить его от ложного срабатывания фильтра нельзя,
+            # поэтому до истечения вытесненных записей он считается отозванным
+            if time.time() < self._overflow_until:
+                self.overflow_hits += 1
+                return True
+            self.false_positives += 1
+            return False
+        return exp > time.time()
+
+    # раз в cleanup_interval: снимаем просроченные записи с вершины кучи
+    def _cleanup(self, now: float):
+        self._next_cleanup = time.monotonic() + self.cleanup_interval
+        while self._expiry and self._expiry[0][0] <= now:
+            _, jti = heapq.heappop(self._expiry)
+            del self._revoked[jti]
+            self._stale += 1
+        # перестройка фильтра стоит O(capacity), поэтому делается, только когда устаревших битов накопилось
+        # на половину емкости: до этого они лишь чуть повышают долю ложных "возможно да".
+        # Пока живы вытесненные jti, их биты - единственная запись об отзыве, фильтр не перестраивается.
+        if self._stale < max(1, self.capacity // 2) or now < self._overflow_until:
+            return
+        self._stale = 0
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for jti in self._revoked:
+            bloom.add(jti)
+        self._bloom = bloom
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._revoked),
+            'capacity': self.capacity,
+            'bloom_negatives': self.bloom_negatives,
+            'false_positives': self.false_positives,
+            'evicted': self.evicted,
+            'overflow_hits': self.overflow_hits,
+        }
+
+
+# Тот же список в общем бэкенде (cache.SharedBackend): отзыв в одном воркере виден всем.
+# Каждая проверка - один GET в бэкенд, запись удаляется бэкендом по TTL в момент exp токена.
+class SharedRevocationList:
+    def __init__(self, store):
+        self.store = store
+        self.checks = 0
+        self.revoked_hits = 0
+
+    async def revoke(self, jti: str, exp: float):
+        ttl = math.ceil(exp - time.time())
+        if ttl <= 0:
+            return
+        await self.store.set(f'revoked:{jti}', exp, ttl=ttl)
+
+    async def is_revoked(self, jti: str | None) -> bool:
+        if jti is None:
+            return False
+        self.checks += 1
+        exp = await self.store.get(f'revoked:{jti}')
+        if exp is None or exp <= time.time():
+            return False
+        self.revoked_hits += 1
+        return True
+
+    def stats(self) -> dict:
+        return {'checks': self.checks, 'revoked_hits': self.revoked_hits}
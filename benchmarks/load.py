@@ -0,0 +1,143 @@
+import asyncio
+import time
+from pathlib import Path
+
+import httpx
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import main
+import todo_app
+from auth import LoginRateLimiter
+from cache import MemoryBackend
+import users_app
+from db.config import AsyncTodoTools
+from db.models import Base
+from db.users import AsyncUserTools
+from exceptions.main import app as exceptions_app
+from serialization import FastJSONRoute, set_fast_json
+
+
+# todo_app и users_app переключаются на локальный SQLite, чтобы прогон не зависел от PostgreSQL
+async def use_sqlite(path: Path):
+    if path.exists():
+        path.unlink()
+    engine = create_async_engine(f'sqlite+aiosqlite:///{path}')
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    for tools in (AsyncTodoTools, AsyncUserTools):
+        tools.engine = engine
+        tools.session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    return engine
+
+
+# без allow_errors сценарий падает на любом ответе не 2xx: иначе замер тихо превращается в замер отказов (429, 404)
+async def run_scenario(name: str, app, requests: int, concurrency: int, make_request, allow_errors: bool = False):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    counter = iter(range(requests))
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def worker():
+            for i in counter:
+                t = time.perf_counter()
+                response = await make_request(client, i)
+                latencies.append(time.perf_counter() - t)
+                if not allow_errors and not response.is_success:
+                    raise RuntimeError(f'{name}: {response.status_code} {response.text}')
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return name, latencies, elapsed
+
+
+# одни и те же роуты с обычной сериализацией FastAPI и с быстрым путем FastJSONRoute
+async def run_serialization(n: int, auth: dict) -> list:
+    apps = (todo_app.app, users_app.app, main.app)
+    saved = [(route, route.fast_json) for app in apps for route in app.routes if isinstance(route, FastJSONRoute)]
+    results = []
+    try:
+        # первый проход прогревает кеш пользователей и соединения, в результаты не попадает
+        for mode in ('warmup', 'default', 'fast_json'):
+            for app in apps:
+                set_fast_json(app, mode == 'fast_json')
+            batch = [
+                await run_scenario(
+                    f'load.{mode}.todo_list', todo_app.app, n, 8, lambda c, i: c.get('/todo_list?limit=100'),
+                ),
+                await run_scenario(
+                    f'load.{mode}.users', users_app.app, n, 8, lambda c, i: c.get(f'/users?user_id={i % 50 + 1}'),
+                ),
+                await run_scenario(f'load.{mode}.info', main.app, n, 8, lambda c, i: c.get('/info', headers=auth)),
+            ]
+            if mode != 'warmup':
+                results.extend(batch)
+    finally:
+        for route, fast_json in saved:
+            route.fast_json = fast_json
+    return results
+
+
+async def run(scale: float = 1.0, db_path: Path = Path('bench.sqlite3')):
+    engine = await use_sqlite(db_path)
+    n = max(1, int(500 * scale))
+    results = []
+    try:
+        await AsyncUserTools.seed_users(list(main.demo_users.values()))
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            response = await client.post('/token', data={'username': 'johndoe', 'password': 'secret'})
+            auth = {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+        # все запросы бенчмарка идут от одного адреса и пользователя - лимитер с настройками по умолчанию
+        # отклонил бы почти весь шторм (429), а измерить нужно путь проверки пароля
+        login_limiter, main.login_limiter = main.login_limiter, LoginRateLimiter(
+            MemoryBackend(), user_rate=1000, user_burst=1000, ip_rate=1000, ip_burst=1000,
+        )
+        try:
+            results.append(await run_scenario(
+                'load.login_storm', main.app, max(4, int(20 * scale)), 8,
+                lambda c, i: c.post('/token', data={'username': 'johndoe', 'password': 'secret'}),
+            ))
+        finally:
+            main.login_limiter = login_limiter
+        results.append(await run_scenario(
+            'load.token_reads', main.app, n, 16,
+            lambda c, i: c.get(('/info', '/admin', '/protected_resource')[i % 3], headers=auth),
+        ))
+
+        # заранее заполняем таблицы, чтобы чтения и обновления в смеси попадали в существующие строки
+        async with engine.begin() as conn:
+            await conn.execute(Base.metadata.tables['Todo'].insert(),
+                               [{'title': f'seed {i}', 'description': 'bench', 'completed': False} for i in range(n)])
+            await conn.execute(text('INSERT INTO users (username, email) VALUES (:username, :email)'),
+                               [{'username': f'seed{i}', 'email': f'seed{i}@example.com'} for i in range(n)])
+
+        async def todo_mix(c, i):
+            op = i % 4
+            if op == 0:
+                return await c.post('/todo', json={'title': f'todo {i}', 'description': 'bench'})
+            if op == 1:
+                return await c.get(f'/todos-header/{i // 4 + 1}')
+            if op == 2:
+                return await c.put(f'/update?pk={i // 4 + 1}', json={'title': f'upd {i}', 'completed': True})
+            return await c.get('/todo_list?limit=50')
+
+        results.extend(await run_serialization(n, auth))
+        results.append(await run_scenario('load.todo_crud_mix', todo_app.app, n, 8, todo_mix))
+
+        async def users_mix(c, i):
+            if i % 5 == 0:
+                return await c.post('/users', json={'username': f'user{i}', 'email': f'user{i}@example.com'})
+            return await c.get(f'/users?user_id={i // 5 + 1}')
+
+        results.append(await run_scenario('load.users_mix', users_app.app, n, 8, users_mix))
+        results.append(await run_scenario(
+            'load.exception_handlers', exceptions_app, n, 16,
+            lambda c, i: c.get(('/items/1', '/items_2/2', '/items_3/3')[i % 3]), allow_errors=True,
+        ))
+    finally:
+        await engine.dispose()
+        db_path.unlink(missing_ok=True)
+    return results
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from fastapi.encoders import jsonable_encoder
+from jose import jwt
+from starlette.responses import JSONResponse
+
+import main
+import todo_app
+from pydantic_models import Todo, TodoPage
+from serialization import FastJSONRoute
+
+
+def measure(name: str, func, iterations: int) -> tuple[str, list[float], float]:
+    func()  # прогрев
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t)
+    return name, latencies, time.perf_counter() - started
+
+
+def run(scale: float = 1.0) -> list[tuple[str, list[float], float]]:
+    user_dict = main.demo_users['johndoe']
+    token = main.create_access_token({'sub': 'johndoe'}, expires_delta=timedelta(minutes=30))
+    todo_dict = {'id': 1, 'title': 'title', 'description': 'description', 'completed': False}
+    hashed = user_dict['hashed_password']
+    n = max(1, int(2000 * scale))
+    page = TodoPage(items=[Todo(**{**todo_dict, 'id': i}) for i in range(100)], next_cursor=100)
+    page_route = next(r for r in todo_app.app.routes if isinstance(r, FastJSONRoute) and r.path == '/todo_list')
+
+    return [
+        measure('micro.create_access_token', lambda: main.create_access_token({'sub': 'johndoe'}), n),
+        measure('micro.jwt_decode', lambda: jwt.decode(token, main.SECRET_KEY, algorithms=[main.ALGORITHM]), n),
+        measure('micro.verify_password', lambda: main.verify_password('secret', hashed), max(1, int(10 * scale))),
+        measure('micro.userindb_model', lambda: main.UserInDB(**user_dict), n * 5),
+        measure('micro.todo_model', lambda: Todo(**todo_dict), n * 5),
+        # тело страницы /todo_list из 100 задач: jsonable_encoder + json.dumps против быстрого пути роута
+        measure('micro.default.todo_page_json', lambda: JSONResponse(jsonable_encoder(page)), n),
+        measure('micro.fast_json.todo_page_json', lambda: page_route.render(page), n),
+    ]
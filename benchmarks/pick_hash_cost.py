@@ -0,0 +1,20 @@
+# Подбор стоимости хеширования паролей под целевую задержку проверки на текущем железе:
+# python -m benchmarks.pick_hash_cost --target-ms 250 [--scheme argon2]
+import argparse
+
+from auth import pick_cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pick password hashing cost for a target verify latency')
+    parser.add_argument('--target-ms', type=float, default=250)
+    parser.add_argument('--scheme', choices=('bcrypt', 'argon2'), default='bcrypt')
+    parser.add_argument('--argon2-memory-cost', type=int, default=65536, help='KiB')
+    parser.add_argument('--argon2-parallelism', type=int, default=4)
+    args = parser.parse_args()
+    print(pick_cost(args.target_ms, args.scheme, argon2_memory_cost=args.argon2_memory_cost,
+                    argon2_parallelism=args.argon2_parallelism))
+
+
+if __name__ == '__main__':
+    main()
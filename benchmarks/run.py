@@ -0,0 +1,47 @@
+# Запуск: python -m benchmarks.run [--scale 0.2] [--save-baseline] [--threshold 0.2]
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from benchmarks import load, micro
+from benchmarks.stats import compare, format_table, load_results, save_results, summarize
+
+DEFAULT_BASELINE = Path(__file__).parent / 'baseline.json'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks and in-process ASGI load scenarios')
+    parser.add_argument('--only', choices=('micro', 'load'), help='run only one group')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for iteration/request counts')
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed p50/p99 slowdown, 0.2 = 20%%')
+    args = parser.parse_args()
+
+    raw = []
+    if args.only in (None, 'micro'):
+        raw.extend(micro.run(args.scale))
+    if args.only in (None, 'load'):
+        raw.extend(asyncio.run(load.run(args.scale)))
+    results = [summarize(name, latencies, elapsed) for name, latencies, elapsed in raw]
+
+    baseline = load_results(args.baseline) if args.baseline.exists() else None
+    print(format_table(results, baseline))
+
+    if args.save_baseline:
+        save_results(args.baseline, results)
+        print(f'Baseline saved to {args.baseline}')
+        return 0
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\nRegressions:')
+            print('\n'.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
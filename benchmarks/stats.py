@@ -0,0 +1,58 @@
+import json
+import statistics
+from pathlib import Path
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# результат одного сценария: задержки в секундах и общее время прогона
+def summarize(name: str, latencies: list[float], elapsed: float) -> dict:
+    return {
+        'name': name,
+        'count': len(latencies),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def save_results(path: Path, results: list[dict]):
+    path.write_text(json.dumps({r['name']: r for r in results}, indent=2, ensure_ascii=False))
+
+
+def load_results(path: Path) -> dict:
+    return json.loads(path.read_text())
+
+
+# регрессия - p50 или p99 выросли больше чем на threshold (0.2 = 20%) относительно сохраненного прогона
+def compare(results: list[dict], baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for result in results:
+        base = baseline.get(result['name'])
+        if base is None:
+            continue
+        for metric in ('p50_ms', 'p99_ms'):
+            if base[metric] and result[metric] > base[metric] * (1 + threshold):
+                regressions.append(
+                    f"{result['name']}: {metric} {base[metric]:.3f} -> {result[metric]:.3f} "
+                    f"(+{(result[metric] / base[metric] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def format_table(results: list[dict], baseline: dict | None = None) -> str:
+    lines = [f"{'scenario':40} {'count':>7} {'p50 ms':>10} {'p99 ms':>10} {'req/s':>10} {'vs base p50':>12}"]
+    for r in results:
+        delta = ''
+        if baseline and r['name'] in baseline and baseline[r['name']]['p50_ms']:
+            delta = f"{(r['p50_ms'] / baseline[r['name']]['p50_ms'] - 1) * 100:+.0f}%"
+        lines.append(f"{r['name']:40} {r['count']:>7} {r['p50_ms']:>10.3f} {r['p99_ms']:>10.3f} "
+                     f"{r['rps']:>10.1f} {delta:>12}")
+    return '\n'.join(lines)
@@ -0,0 +1,21 @@
+__all__ = (
+    'BatchLoader',
+    'CacheSettings',
+    'cache_settings',
+    'MemoryBackend',
+    'SharedBackend',
+    'create_backend',
+    'ReadThroughCache',
+    'SingleFlight',
+    'default_backend',
+)
+
+from cache.backends import MemoryBackend, SharedBackend, create_backend
+from cache.batch_loader import BatchLoader
+from cache.config import CacheSettings, cache_settings
+from cache.read_through import ReadThroughCache
+from cache.single_flight import SingleFlight
+
+# общий для всех приложений процесса бэкенд, выбирается через CACHE_BACKEND
+default_backend = create_backend(cache_settings.CACHE_BACKEND, cache_settings.CACHE_URL,
+                                 cache_settings.CACHE_MAX_SIZE)
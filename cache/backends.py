@@ -0,0 +1,89 @@
+import json
+import time
+from collections import OrderedDict
+
+
+# Бэкенды хранят JSON-совместимые значения (dict, list, str, числа).
+class MemoryBackend:
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def get_many(self, keys: list[str]) -> list:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    # прочитать и удалить одной операцией: значение получит только один из конкурентов
+    async def pop(self, key: str):
+        value = await self.get(key)
+        self._entries.pop(key, None)
+        return value
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Общий кеш поверх redis-подобного клиента (async get / mget / set(ex=) / getdel / delete).
+# В тестах вместо redis можно передать любой объект с тем же интерфейсом.
+class SharedBackend:
+    def __init__(self, client, prefix: str = 'rbac:'):
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    # один MGET вместо запроса на каждый ключ
+    async def get_many(self, keys: list[str]) -> list:
+        raws = await self.client.mget([self.prefix + key for key in keys])
+        return [json.loads(raw) if raw is not None else None for raw in raws]
+
+    async def set(self, key: str, value, ttl: float):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=max(int(ttl), 1))
+
+    # GETDEL (Redis 6.2+) атомарен - значение получит только один из воркеров
+    async def pop(self, key: str):
+        raw = await self.client.getdel(self.prefix + key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+
+def create_backend(name: str, url: str | None = None, max_size: int = 10_000):
+    if name == 'memory':
+        return MemoryBackend(max_size=max_size)
+    if name == 'redis':
+        try:
+            from redis import asyncio as aioredis
+        except ImportError:
+            raise RuntimeError('CACHE_BACKEND=redis requires the redis package') from None
+        return SharedBackend(aioredis.from_url(url))
+    raise ValueError(f'Unknown cache backend: {name}')
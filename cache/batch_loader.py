@@ -0,0 +1,75 @@
+import asyncio
+
+
+# Загрузка по ключам с объединением запросов. Одинаковые ключи, уже ждущие загрузки или загружаемые,
+# получают общий результат (single-flight). Разные ключи, пришедшие в течение window секунд, загружаются
+# одним вызовом load_many(keys) -> {key: value}, т.е. одним WHERE id IN (...). При window = 0 в пачку
+# попадают только ключи, запрошенные до ближайшей итерации event loop - лишней задержки нет.
+# Ничего не хранится после загрузки, поэтому устаревших данных быть не может.
+class BatchLoader:
+    def __init__(self, load_many, window: float = 0.0, max_batch: int = 500):
+        self.load_many = load_many
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: dict[object, asyncio.Future] = {}
+        self._in_flight: dict[object, asyncio.Future] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+        self.keys = 0
+        self.shared = 0
+
+    async def load(self, key):
+        future = self._pending.get(key) or self._in_flight.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        if len(self._pending) >= self.max_batch or self.window <= 0:
+            self._spawn(self._dispatch())
+        elif len(self._pending) == 1:
+            self._spawn(self._dispatch_later())
+        return await asyncio.shield(future)
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch_later(self):
+        await asyncio.sleep(self.window)
+        await self._dispatch()
+
+    async def _dispatch(self):
+        batch, self._pending = self._pending, {}
+        if not batch:
+            return
+        self._in_flight.update(batch)
+        self.batches += 1
+        self.keys += len(batch)
+        try:
+            values = await self.load_many(list(batch))
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in batch.values():
+                future.set_exception(e)
+                # исключение получат ждущие, если они еще есть
+                future.exception()
+        else:
+            for key, future in batch.items():
+                future.set_result(values.get(key))
+        finally:
+            for key, future in batch.items():
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            'batches': self.batches,
+            'keys': self.keys,
+            'shared': self.shared,
+        }
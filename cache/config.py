@@ -0,0 +1,23 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+dotenv_path = Path(__file__).parent.parent / '.env'
+
+load_dotenv(dotenv_path=dotenv_path)
+
+
+class CacheSettings:
+    # memory - LRU в памяти процесса, redis - общий кеш для всех воркеров
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_URL = os.getenv('CACHE_URL', 'redis://localhost:6379/0')
+    CACHE_TTL = float(os.getenv('CACHE_TTL', 60))
+    CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', 10_000))
+    # окно (мс), в течение которого чтения разных id по промахам кеша собираются в один WHERE id IN (...);
+    # 0 - объединяются только одновременные запросы
+    READ_BATCH_WINDOW_MS = float(os.getenv('READ_BATCH_WINDOW_MS', 0))
+    READ_BATCH_MAX_SIZE = int(os.getenv('READ_BATCH_MAX_SIZE', 500))
+
+
+cache_settings = CacheSettings()
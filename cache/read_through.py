@@ -0,0 +1,68 @@
+from cache.single_flight import SingleFlight
+
+
+# Read-through кеш: при промахе значение загружается из БД, одновременные промахи
+# по одному ключу приводят к одному запросу.
+class ReadThroughCache:
+    def __init__(self, backend, namespace: str, ttl: float = 60):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._single_flight = SingleFlight()
+        # меняется при каждой записи/инвалидации, чтобы загрузка, начатая до них, не положила в кеш старые данные
+        self._generation = 0
+
+    def key(self, key) -> str:
+        return f'{self.namespace}:{key}'
+
+    async def get_or_load(self, key, loader):
+        full_key = self.key(key)
+        value = await self.backend.get(full_key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        return await self._single_flight.do(full_key, lambda: self._load(full_key, loader))
+
+    async def _load(self, full_key: str, loader):
+        generation = self._generation
+        value = await loader()
+        if value is not None and generation == self._generation:
+            await self.backend.set(full_key, value, self.ttl)
+        return value
+
+    # Пакетное чтение: найденное в кеше берется оттуда, промахи грузятся одним вызовом
+    # load_many(keys) -> {key: value}; отсутствующие в БД ключи в результат не попадают
+    async def get_many_or_load(self, keys: list, load_many) -> dict:
+        values = await self.backend.get_many([self.key(key) for key in keys])
+        found = {key: value for key, value in zip(keys, values) if value is not None}
+        missing = [key for key in keys if key not in found]
+        self.hits += len(found)
+        if not missing:
+            return found
+        self.misses += len(missing)
+        generation = self._generation
+        loaded = await load_many(missing)
+        if generation == self._generation:
+            for key, value in loaded.items():
+                await self.backend.set(self.key(key), value, self.ttl)
+        found.update(loaded)
+        return found
+
+    async def set(self, key, value):
+        self._generation += 1
+        await self.backend.set(self.key(key), value, self.ttl)
+
+    async def invalidate(self, key):
+        self._generation += 1
+        await self.backend.delete(self.key(key))
+
+    def stats(self) -> dict:
+        return {
+            'namespace': self.namespace,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self._single_flight.shared,
+        }
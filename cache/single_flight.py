@@ -0,0 +1,30 @@
+import asyncio
+
+
+# Схлопывает одновременные вызовы с одинаковым ключом: загрузчик выполняется один раз,
+# остальные ждут его результат. Загрузчик работает в своей задаче, а все вызывающие ждут ее через shield:
+# отмена одного запроса (отключился клиент, таймаут) не отменяет загрузку и не роняет остальных.
+class SingleFlight:
+    def __init__(self):
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.shared = 0
+
+    async def do(self, key: str, loader):
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            task = asyncio.create_task(loader())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # исключение получат ждущие, если они еще есть
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self):
+        return len(self._in_flight)
@@ -1,14 +1,26 @@
+import base64
+import json
 import os
-from contextlib import contextmanager
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
 from pathlib import Path
 
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine, delete, event, func, insert, literal_column, or_, select, \
+    text, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
+from cache import BatchLoader, ReadThroughCache, cache_settings, default_backend
 from db.models import TodoTable, Base
-from pydantic_models import TodoPayload
+from exceptions import idempotency_conflict_exc
+from metrics import observe_phase, registry
+from pydantic_models import BulkItemResult, Todo, TodoBulkUpdate, TodoPayload
 
 dotenv_path = Path(__file__).parent.parent / '.env'
 
@@ -23,11 +35,236 @@ class DB_Settings:
     DB_NAME = os.getenv('DB_NAME')
 
     DB_PSYCOPG2_URL = f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+    DB_ASYNCPG_URL = f'postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
     DB_URL = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 
+    # настройки пула, общие для всех приложений
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    # statement_timeout в миллисекундах, 0 - без ограничения
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+    DB_ECHO = os.getenv('DB_ECHO', 'false').lower() == 'true'
+    # кеш подготовленных выражений asyncpg на соединение; 0 - отключить (нужно за pgbouncer в режиме transaction)
+    DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv('DB_PREPARED_STATEMENT_CACHE_SIZE', 500))
+
 
 settings = DB_Settings()
-engine = create_engine(url=settings.DB_PSYCOPG2_URL, echo=True)
+
+
+# время ожидания свободного соединения из пула
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe_wait(self, wait: float):
+        observe_phase('db_checkout', wait)
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'wait_seconds_total': self.wait_seconds,
+                'max_wait_seconds': self.max_wait_seconds,
+            }
+
+
+pool_stats = PoolStats()
+
+
+def engine_options(url: str, is_async: bool) -> dict:
+    options = {
+        'echo': settings.DB_ECHO,
+        'pool_size': settings.DB_POOL_SIZE,
+        'max_overflow': settings.DB_MAX_OVERFLOW,
+        'pool_timeout': settings.DB_POOL_TIMEOUT,
+        'pool_recycle': settings.DB_POOL_RECYCLE,
+        'pool_pre_ping': settings.DB_POOL_PRE_PING,
+    }
+    if not url.startswith('postgresql'):
+        return options
+    connect_args = {}
+    if is_async:
+        connect_args['prepared_statement_cache_size'] = settings.DB_PREPARED_STATEMENT_CACHE_SIZE
+    if settings.DB_STATEMENT_TIMEOUT:
+        if is_async:
+            connect_args['server_settings'] = {'statement_timeout': str(settings.DB_STATEMENT_TIMEOUT)}
+        else:
+            connect_args['options'] = f'-c statement_timeout={settings.DB_STATEMENT_TIMEOUT}'
+    options['connect_args'] = connect_args
+    return options
+
+
+# время выполнения каждого запроса к БД в метрику db_query
+def install_query_timing(sync_engine: Engine):
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        observe_phase('db_query', time.perf_counter() - context._query_started)
+
+
+# Один sync и один async движок на процесс - их используют все приложения
+@lru_cache(maxsize=None)
+def get_engine(url: str = settings.DB_PSYCOPG2_URL) -> Engine:
+    db_engine = create_engine(url=url, **engine_options(url, is_async=False))
+    install_query_timing(db_engine)
+    return db_engine
+
+
+@lru_cache(maxsize=None)
+def get_async_engine(url: str = settings.DB_ASYNCPG_URL) -> AsyncEngine:
+    db_engine = create_async_engine(url=url, **engine_options(url, is_async=True))
+    install_query_timing(db_engine.sync_engine)
+    return db_engine
+
+
+def pool_status(db_engine: Engine | AsyncEngine) -> dict:
+    pool = db_engine.pool
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'checked_in': pool.checkedin(),
+        'overflow': pool.overflow(),
+    }
+
+
+def pool_statistics() -> dict:
+    return {
+        'sync': pool_status(get_engine()),
+        'async': pool_status(get_async_engine()),
+        **pool_stats.snapshot(),
+    }
+
+
+async def dispose_engines():
+    await get_async_engine().dispose()
+    get_engine().dispose()
+
+
+# Вызывается в дочернем процессе после fork: соединения родителя не закрываются (они ему и принадлежат),
+# а просто забываются, и воркер открывает свои
+def reset_pools_after_fork():
+    get_engine().dispose(close=False)
+    get_async_engine().sync_engine.dispose(close=False)
+
+
+engine = get_engine()
+registry.register_collector('db_pool', pool_statistics)
+
+
+# INSERT с поддержкой ON CONFLICT есть только в диалектах PostgreSQL и SQLite
+def dialect_insert(dialect_name: str, table):
+    dialect_inserts = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+    if dialect_name not in dialect_inserts:
+        raise NotImplementedError(f'ON CONFLICT is not supported for {dialect_name}')
+    return dialect_inserts[dialect_name](table)
+
+
+# INSERT ... ON CONFLICT DO UPDATE ... RETURNING одним запросом. Обновление конфликтной колонки самой на себя
+# ничего не меняет, но в отличие от DO NOTHING позволяет RETURNING вернуть и уже существующую строку.
+def upsert_todo_statement(dialect_name: str, values: dict, conflict_column: str):
+    statement = dialect_insert(dialect_name, TodoTable).values(**values)
+    return statement.on_conflict_do_update(
+        index_elements=[conflict_column], set_={conflict_column: statement.excluded[conflict_column]}
+    ).returning(TodoTable)
+
+
+# В PostgreSQL явный id не двигает последовательность SERIAL, и следующий обычный INSERT получил бы занятый id.
+# Поэтому перед коммитом upsert последовательность подтягивается до этого id - только вперед, если она отстает.
+TODO_ID_SEQUENCE_ADVANCE = text(
+    "SELECT setval(seq, pk) FROM ("
+    f"SELECT pg_get_serial_sequence('\"{TodoTable.__tablename__}\"', 'id')::regclass AS seq, CAST(:pk AS bigint) AS pk"
+    ") AS target WHERE pk > coalesce(pg_sequence_last_value(seq), 0)"
+)
+
+
+# Значения для upsert: конфликт по id, если он задан, иначе по ключу идемпотентности.
+# Если заданы оба, а ключ уже занят другой задачей, вставка падает на уникальности ключа - это 409.
+def upsert_todo_values(todo_data: TodoPayload, pk: int | None, idempotency_key: str | None) -> tuple[dict, str]:
+    if pk is None and idempotency_key is None:
+        raise ValueError('Upsert requires pk or idempotency_key')
+    values = todo_data.model_dump(include={'title', 'description', 'completed'})
+    if idempotency_key is not None:
+        values['idempotency_key'] = idempotency_key
+    if pk is not None:
+        values['id'] = pk
+        return values, 'id'
+    return values, 'idempotency_key'
+
+
+# create_all не создает индексы уже существующей таблицы - недостающие досоздаются отдельно.
+# На большой таблице в PostgreSQL лучше заранее создать их вручную через CREATE INDEX CONCURRENTLY (см. README).
+def create_todo_indexes(connection):
+    for index in TodoTable.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+# То же выражение, что в индексе ix_todo_search: константы вписаны в SQL, а не переданы параметрами,
+# иначе PostgreSQL не сопоставит выражение с индексом
+TODO_SEARCH_VECTOR = func.to_tsvector(
+    literal_column("'simple'::regconfig"),
+    TodoTable.title.op('||')(literal_column("' '")).op('||')(func.coalesce(TodoTable.description, literal_column("''"))),
+)
+
+
+# Курсор для сортировок по id - сам id (как раньше), для сортировок по title - непрозрачная строка с (title, id)
+def encode_todo_cursor(sort: str, todo: TodoTable) -> int | str:
+    if sort.lstrip('-') == 'id':
+        return todo.id
+    return base64.urlsafe_b64encode(json.dumps([todo.title, todo.id]).encode()).decode()
+
+
+def decode_todo_cursor(sort: str, cursor: str | None) -> int | tuple[str, int] | None:
+    if cursor is None:
+        return None
+    if sort.lstrip('-') == 'id':
+        return int(cursor)
+    try:
+        title, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor') from None
+    if not isinstance(title, str) or not isinstance(pk, int):
+        raise ValueError('Invalid cursor')
+    return title, pk
+
+
+# Фильтры и сортировка /todo_list. Каждое условие обслуживается своим индексом (см. TodoTable.__table_args__)
+def todo_page_query(dialect_name: str, sort: str = 'id', after=None, completed: bool | None = None,
+                    title_prefix: str | None = None, search: str | None = None):
+    descending = sort.startswith('-')
+    columns = (TodoTable.title, TodoTable.id) if sort.lstrip('-') == 'title' else (TodoTable.id,)
+    query = select(TodoTable).order_by(*(column.desc() if descending else column.asc() for column in columns))
+    if after is not None:
+        key, value = (tuple_(*columns), tuple_(*after)) if len(columns) > 1 else (columns[0], after)
+        query = query.where(key < value if descending else key > value)
+    if completed is not None:
+        query = query.where(TodoTable.completed.is_(True) if completed else TodoTable.completed.isnot(True))
+    if title_prefix:
+        # шаблон собирается здесь, а не конкатенацией в SQL: с готовым 'abc%' PostgreSQL использует индекс по префиксу
+        pattern = title_prefix.replace('/', '//').replace('%', '/%').replace('_', '/_') + '%'
+        query = query.where(TodoTable.title.like(pattern, escape='/'))
+    if search:
+        if dialect_name == 'postgresql':
+            query = query.where(TODO_SEARCH_VECTOR.op('@@')(
+                func.plainto_tsquery(literal_column("'simple'::regconfig"), search)
+            ))
+        else:
+            # без полнотекстового индекса (SQLite в тестах и бенчмарках) - поиск подстроки
+            query = query.where(or_(TodoTable.title.contains(search, autoescape=True),
+                                    TodoTable.description.contains(search, autoescape=True)))
+    return query
 
 
 def db_session_method(method):
@@ -38,13 +275,23 @@ def db_session_method(method):
     return wrapper
 
 
+def async_db_session_method(method):
+    async def wrapper(cls, *args, **kwargs):
+        async with cls.get_db_session() as db:
+            return await method(cls, db, *args, **kwargs)
+
+    return wrapper
+
+
 class TodoTools:
-    engine = create_engine(url=settings.DB_PSYCOPG2_URL, echo=True)
+    engine = get_engine()
     session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     @classmethod
     def create_tables(cls):
         Base.metadata.create_all(cls.engine)
+        with cls.engine.begin() as conn:
+            create_todo_indexes(conn)
         print(f'Таблицы созданы')
 
     @classmethod
@@ -56,11 +303,29 @@ class TodoTools:
         db.refresh(todo)
         return todo
 
+    # get-or-create одним запросом: существующая строка возвращается без изменений, дубликаты невозможны
+    @classmethod
+    @db_session_method
+    def upsert_todo(cls, db: Session, todo_data: TodoPayload, pk: int | None = None,
+                    idempotency_key: str | None = None):
+        values, conflict_column = upsert_todo_values(todo_data, pk, idempotency_key)
+        statement = upsert_todo_statement(cls.engine.dialect.name, values, conflict_column)
+        try:
+            todo = db.scalars(statement, execution_options={'populate_existing': True}).one()
+            if pk is not None and cls.engine.dialect.name == 'postgresql':
+                db.execute(TODO_ID_SEQUENCE_ADVANCE, {'pk': pk})
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            if pk is not None and idempotency_key is not None:
+                raise idempotency_conflict_exc
+            raise
+        return todo
+
     @classmethod
     @db_session_method
     def get_all_todos(cls, db):
         res = db.query(TodoTable).all()
-        print(res)
         return res
 
     @classmethod
@@ -99,6 +364,240 @@ class TodoTools:
     def get_db_session(cls):
         db = cls.session()
         try:
+            started = time.perf_counter()
+            db.connection()
+            pool_stats.observe_wait(time.perf_counter() - started)
             yield db
         finally:
             db.close()
+
+
+# Асинхронный вариант TodoTools с тем же набором методов - для async роутов, чтобы запросы в БД не блокировали event loop
+class AsyncTodoTools:
+    engine = get_async_engine()
+    session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    # сколько строк пишется одним запросом и одной транзакцией в bulk-методах
+    bulk_chunk_size = 1000
+    # кеш отдельных todo по id, сбрасывается при изменении и удалении
+    cache = ReadThroughCache(default_backend, 'todo', ttl=cache_settings.CACHE_TTL)
+    loader = BatchLoader(lambda pks: AsyncTodoTools._fetch_todos(pks),
+                         window=cache_settings.READ_BATCH_WINDOW_MS / 1000,
+                         max_batch=cache_settings.READ_BATCH_MAX_SIZE)
+
+    @classmethod
+    async def create_tables(cls):
+        async with cls.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(create_todo_indexes)
+        print(f'Таблицы созданы')
+
+    @classmethod
+    @async_db_session_method
+    async def add_todo(cls, db: AsyncSession, todo_data: TodoPayload):
+        todo = TodoTable(title=todo_data.title, description=todo_data.description, completed=todo_data.completed)
+        db.add(todo)
+        await db.commit()
+        await db.refresh(todo)
+        return todo
+
+    @classmethod
+    @async_db_session_method
+    async def upsert_todo(cls, db: AsyncSession, todo_data: TodoPayload, pk: int | None = None,
+                          idempotency_key: str | None = None):
+        values, conflict_column = upsert_todo_values(todo_data, pk, idempotency_key)
+        statement = upsert_todo_statement(cls.engine.dialect.name, values, conflict_column)
+        try:
+            todo = (await db.scalars(statement, execution_options={'populate_existing': True})).one()
+            if pk is not None and cls.engine.dialect.name == 'postgresql':
+                await db.execute(TODO_ID_SEQUENCE_ADVANCE, {'pk': pk})
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            if pk is not None and idempotency_key is not None:
+                raise idempotency_conflict_exc
+            raise
+        return todo
+
+    # Bulk-методы пишут чанками: один многострочный запрос и одна транзакция на чанк.
+    # Ошибка в чанке откатывает только его, результат возвращается по каждому элементу.
+    @classmethod
+    @async_db_session_method
+    async def add_todos(cls, db: AsyncSession, todos: list[TodoPayload]) -> list[BulkItemResult]:
+        results = []
+        for start in range(0, len(todos), cls.bulk_chunk_size):
+            chunk = todos[start:start + cls.bulk_chunk_size]
+            rows = [todo.model_dump(include={'title', 'description', 'completed'}) for todo in chunk]
+            try:
+                ids = (await db.scalars(
+                    insert(TodoTable).returning(TodoTable.id, sort_by_parameter_order=True), rows
+                )).all()
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                # у задач нет уникальных полей во входных данных, так что ON CONFLICT тут не поможет:
+                # упавший чанк повторяется построчно, каждая строка в своем SAVEPOINT
+                results.extend(await cls._add_todos_one_by_one(db, rows, start))
+                continue
+            results.extend(BulkItemResult(index=start + i, id=pk, status='created') for i, pk in enumerate(ids))
+        return results
+
+    @classmethod
+    async def _add_todos_one_by_one(cls, db: AsyncSession, rows: list[dict], start: int) -> list[BulkItemResult]:
+        results = []
+        for i, row in enumerate(rows):
+            try:
+                async with db.begin_nested():
+                    pk = await db.scalar(insert(TodoTable).values(**row).returning(TodoTable.id))
+            except Exception as e:
+                results.append(BulkItemResult(index=start + i, status='error', detail=str(e.__class__.__name__)))
+                continue
+            results.append(BulkItemResult(index=start + i, id=pk, status='created'))
+        await db.commit()
+        return results
+
+    @classmethod
+    @async_db_session_method
+    async def update_todos(cls, db: AsyncSession, todos: list[TodoBulkUpdate]) -> list[BulkItemResult]:
+        results = []
+        for start in range(0, len(todos), cls.bulk_chunk_size):
+            chunk = todos[start:start + cls.bulk_chunk_size]
+            try:
+                existing = set((await db.scalars(
+                    select(TodoTable.id).where(TodoTable.id.in_({todo.id for todo in chunk}))
+                )).all())
+                rows = [todo.model_dump(include={'id', 'title', 'description', 'completed'})
+                        for todo in chunk if todo.id in existing]
+                if rows:
+                    await db.execute(update(TodoTable), rows)
+                await db.commit()
+                for pk in existing:
+                    await cls.cache.invalidate(pk)
+            except Exception as e:
+                await db.rollback()
+                results.extend(BulkItemResult(index=start + i, id=todo.id, status='error',
+                                              detail=str(e.__class__.__name__)) for i, todo in enumerate(chunk))
+                continue
+            results.extend(
+                BulkItemResult(index=start + i, id=todo.id, status='updated')
+                if todo.id in existing else
+                BulkItemResult(index=start + i, id=todo.id, status='not_found',
+                               detail=f'Todo with id {todo.id} does not exist')
+                for i, todo in enumerate(chunk)
+            )
+        return results
+
+    @classmethod
+    @async_db_session_method
+    async def delete_todos(cls, db: AsyncSession, pks: list[int]) -> list[BulkItemResult]:
+        results = []
+        for start in range(0, len(pks), cls.bulk_chunk_size):
+            chunk = pks[start:start + cls.bulk_chunk_size]
+            try:
+                deleted = set((await db.scalars(
+                    delete(TodoTable).where(TodoTable.id.in_(set(chunk))).returning(TodoTable.id)
+                )).all())
+                await db.commit()
+                for pk in deleted:
+                    await cls.cache.invalidate(pk)
+            except Exception as e:
+                await db.rollback()
+                results.extend(BulkItemResult(index=start + i, id=pk, status='error',
+                                              detail=str(e.__class__.__name__)) for i, pk in enumerate(chunk))
+                continue
+            results.extend(
+                BulkItemResult(index=start + i, id=pk, status='deleted')
+                if pk in deleted else
+                BulkItemResult(index=start + i, id=pk, status='not_found',
+                               detail=f'Todo with id {pk} does not exist')
+                for i, pk in enumerate(chunk)
+            )
+        return results
+
+    @classmethod
+    @async_db_session_method
+    async def get_all_todos(cls, db: AsyncSession):
+        res = await db.scalars(select(TodoTable))
+        return res.all()
+
+    # keyset-пагинация: берем на одну запись больше, чтобы понять, есть ли следующая страница.
+    # after - значение из decode_todo_cursor для той же сортировки
+    @classmethod
+    @async_db_session_method
+    async def get_todos_page(cls, db: AsyncSession, after=None, limit: int = 100, sort: str = 'id',
+                             completed: bool | None = None, title_prefix: str | None = None,
+                             search: str | None = None):
+        query = todo_page_query(cls.engine.dialect.name, sort=sort, after=after, completed=completed,
+                                title_prefix=title_prefix, search=search).limit(limit + 1)
+        todos = (await db.scalars(query)).all()
+        next_cursor = None
+        if len(todos) > limit:
+            todos = todos[:limit]
+            next_cursor = encode_todo_cursor(sort, todos[-1])
+        return todos, next_cursor
+
+    # потоковое чтение через серверный курсор: в памяти одновременно не больше chunk_size строк
+    @classmethod
+    async def stream_todos(cls, after: int | None = None, chunk_size: int = 500):
+        query = select(TodoTable).order_by(TodoTable.id).execution_options(yield_per=chunk_size)
+        if after is not None:
+            query = query.where(TodoTable.id > after)
+        async with cls.get_db_session() as db:
+            result = await db.stream_scalars(query)
+            async for todo in result:
+                yield todo
+
+    @classmethod
+    @async_db_session_method
+    async def delete_todo_by_id(cls, db: AsyncSession, pk: int):
+        todo = await db.get(TodoTable, pk)
+        if todo:
+            await db.delete(todo)
+            await db.commit()
+            await cls.cache.invalidate(pk)
+            return f'Todo with id {pk} deleted'
+        else:
+            raise Exception(f'Todo with id {pk} does not exist')
+
+    @classmethod
+    @async_db_session_method
+    async def update_todo(cls, db: AsyncSession, pk: int, todo_data: TodoPayload):
+        todo = await db.get(TodoTable, pk)
+        if todo:
+            todo.title = todo_data.title
+            todo.description = todo_data.description
+            todo.completed = todo_data.completed
+            await db.commit()
+            await cls.cache.invalidate(pk)
+            return f'Todo with id {pk} updated'
+        else:
+            raise Exception(f'Todo with id {pk} does not exist')
+
+    @classmethod
+    @async_db_session_method
+    async def get_todo(cls, db: AsyncSession, pk: int):
+        todo = await db.get(TodoTable, pk)
+        return todo
+
+    @classmethod
+    @async_db_session_method
+    async def _fetch_todos(cls, db: AsyncSession, pks: list[int]) -> dict[int, dict]:
+        todos = await db.scalars(select(TodoTable).where(TodoTable.id.in_(pks)))
+        return {todo.id: Todo.model_validate(todo).model_dump(mode='json') for todo in todos}
+
+    # то же, что get_todo, но через кеш; возвращает dict в формате Todo.
+    # Промахи идут через loader: одновременные чтения одного id - один запрос, разных - один IN (...)
+    @classmethod
+    async def get_todo_cached(cls, pk: int) -> dict | None:
+        return await cls.cache.get_or_load(pk, lambda: cls.loader.load(pk))
+
+    @classmethod
+    @asynccontextmanager
+    async def get_db_session(cls):
+        db = cls.session()
+        try:
+            started = time.perf_counter()
+            await db.connection()
+            pool_stats.observe_wait(time.perf_counter() - started)
+            yield db
+        finally:
+            await db.close()
@@ -1,4 +1,4 @@
-from sqlalchemy import String, Boolean
+from sqlalchemy import Index, String, Boolean, column, false, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -13,8 +13,35 @@ class TodoTable(Base):
     title: Mapped[str] = mapped_column(String(length=50))
     description: Mapped[str] = mapped_column(String(length=200), nullable=True)
     completed: Mapped[bool] = mapped_column(Boolean(), nullable=True)
+    # ключ из заголовка Idempotency-Key: повтор запроса с тем же ключом возвращает уже созданную задачу
+    idempotency_key: Mapped[str] = mapped_column(String(length=64), unique=True, nullable=True)
+
+    __table_args__ = (
+        # частичные индексы для фильтра completed: список открытых/выполненных задач не читает остальные строки
+        Index('ix_todo_open_id', 'id',
+              postgresql_where=column('completed').isnot(True), sqlite_where=column('completed').isnot(True)),
+        Index('ix_todo_done_id', 'id',
+              postgresql_where=column('completed').is_(True), sqlite_where=column('completed').is_(True)),
+        # сортировка по title с keyset-курсором (title, id)
+        Index('ix_todo_title_id', 'title', 'id'),
+        # поиск по префиксу title (LIKE 'abc%') при любой локали БД
+        Index('ix_todo_title_prefix', 'title', postgresql_ops={'title': 'text_pattern_ops'}).ddl_if(
+            dialect='postgresql'),
+        # полнотекстовый поиск; выражение должно совпадать с TODO_SEARCH_VECTOR в db/config.py
+        Index('ix_todo_search', text("to_tsvector('simple'::regconfig, title || ' ' || coalesce(description, ''))"),
+              postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+
+
+# Общая база пользователей для RBAC (main.py) и users_app.py
+class UserTable(Base):
+    __tablename__ = 'users'
 
-
-
-
-
+    id: Mapped[int] = mapped_column(primary_key=True)
+    username: Mapped[str] = mapped_column(String(length=50), unique=True, index=True)
+    email: Mapped[str] = mapped_column(String(length=100), unique=True, index=True)
+    full_name: Mapped[str] = mapped_column(String(length=100), nullable=True)
+    # пользователи, созданные через users_app, не имеют пароля и не могут логиниться
+    hashed_password: Mapped[str] = mapped_column(String(length=200), nullable=True)
+    role: Mapped[str] = mapped_column(String(length=20), default='guest', server_default='guest')
+    disabled: Mapped[bool] = mapped_column(Boolean(), default=False, server_default=false())
@@ -0,0 +1,197 @@
+import time
+from contextlib import asynccontextmanager
+
+from sqlalchemy import Integer, any_, bindparam, delete, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from cache import BatchLoader, MemoryBackend, ReadThroughCache, cache_settings, default_backend
+from db.config import async_db_session_method, dialect_insert, get_async_engine, pool_stats
+from db.models import Base, UserTable
+from pydantic_models import BulkItemResult
+
+USER_COLUMNS = ('id', 'username', 'email', 'full_name', 'hashed_password', 'role', 'disabled')
+# колонки, которые можно держать в общем кеше по id: без хеша пароля и полей, от которых зависят права
+PUBLIC_USER_COLUMNS = ('id', 'username', 'email', 'full_name')
+
+# Чтения идут без ORM, с явным списком колонок и постоянным текстом запроса,
+# чтобы asyncpg переиспользовал подготовленное выражение из своего кеша
+USER_SELECT = select(*(UserTable.__table__.c[column] for column in USER_COLUMNS))
+USER_BY_USERNAME = USER_SELECT.where(UserTable.username == bindparam('username'))
+PUBLIC_USER_SELECT = select(*(UserTable.__table__.c[column] for column in PUBLIC_USER_COLUMNS))
+# = ANY(:ids) с массивом не меняет текст запроса от числа id, в отличие от IN (...)
+USERS_BY_IDS_PG = PUBLIC_USER_SELECT.where(UserTable.id == any_(bindparam('ids', type_=ARRAY(Integer))))
+USERS_BY_IDS = PUBLIC_USER_SELECT.where(UserTable.id.in_(bindparam('ids', expanding=True)))
+
+
+def user_to_dict(user: UserTable) -> dict:
+    return {column: getattr(user, column) for column in USER_COLUMNS}
+
+
+def public_user(user: dict) -> dict:
+    return {column: user[column] for column in PUBLIC_USER_COLUMNS}
+
+
+# Репозиторий пользователей: общий для main.py (аутентификация) и users_app.py (CRUD).
+# Методы возвращают dict, чтобы результат можно было класть в кеш.
+class AsyncUserTools:
+    engine = get_async_engine()
+    session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    # кеш по id - в общем бэкенде, только публичные поля (PUBLIC_USER_COLUMNS); кеш по username для логина
+    # и проверки токенов - только в памяти процесса, т.к. содержит хеш пароля и роль
+    cache = ReadThroughCache(default_backend, 'user', ttl=cache_settings.CACHE_TTL)
+    auth_cache = ReadThroughCache(MemoryBackend(cache_settings.CACHE_MAX_SIZE), 'user_auth',
+                                  ttl=cache_settings.CACHE_TTL)
+    # промахи кеша по id: одновременные чтения объединяются в один запрос
+    loader = BatchLoader(lambda pks: AsyncUserTools._fetch_by_ids(pks),
+                         window=cache_settings.READ_BATCH_WINDOW_MS / 1000,
+                         max_batch=cache_settings.READ_BATCH_MAX_SIZE)
+    # сколько строк пишется одним запросом и одной транзакцией в add_users
+    bulk_chunk_size = 1000
+    # async-функции username -> None, вызываются, когда пользователь удален, заблокирован или переименован
+    access_revoked_listeners = []
+
+    @classmethod
+    def on_access_revoked(cls, listener):
+        cls.access_revoked_listeners.append(listener)
+
+    @classmethod
+    async def _access_revoked(cls, username: str):
+        for listener in cls.access_revoked_listeners:
+            await listener(username)
+
+    @classmethod
+    async def create_tables(cls):
+        async with cls.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    @classmethod
+    @async_db_session_method
+    async def _fetch_by_username(cls, db: AsyncSession, username: str) -> dict | None:
+        user = (await db.execute(USER_BY_USERNAME, {'username': username})).mappings().first()
+        return dict(user) if user else None
+
+    @classmethod
+    @async_db_session_method
+    async def _fetch_by_ids(cls, db: AsyncSession, pks: list[int]) -> dict[int, dict]:
+        query = USERS_BY_IDS_PG if cls.engine.dialect.name == 'postgresql' else USERS_BY_IDS
+        users = (await db.execute(query, {'ids': pks})).mappings()
+        return {user['id']: dict(user) for user in users}
+
+    # один запрос по уникальному индексу username, результат кешируется
+    @classmethod
+    async def get_by_username(cls, username: str) -> dict | None:
+        return await cls.auth_cache.get_or_load(username, lambda: cls._fetch_by_username(username))
+
+    # get_by_id/get_by_ids возвращают только PUBLIC_USER_COLUMNS
+    @classmethod
+    async def get_by_id(cls, pk: int) -> dict | None:
+        return await cls.cache.get_or_load(pk, lambda: cls.loader.load(pk))
+
+    # несколько пользователей: найденные в кеше берутся оттуда, остальные - одним запросом; порядок как в pks,
+    # несуществующие id пропускаются
+    @classmethod
+    async def get_by_ids(cls, pks: list[int]) -> list[dict]:
+        pks = list(dict.fromkeys(pks))
+        users = await cls.cache.get_many_or_load(pks, cls._fetch_by_ids)
+        return [users[pk] for pk in pks if pk in users]
+
+    @classmethod
+    @async_db_session_method
+    async def add_user(cls, db: AsyncSession, username: str, email: str, hashed_password: str | None = None,
+                       full_name: str | None = None, role: str = 'guest', disabled: bool = False) -> dict:
+        user = UserTable(username=username, email=email, hashed_password=hashed_password, full_name=full_name,
+                         role=role, disabled=disabled)
+        db.add(user)
+        await db.commit()
+        created = user_to_dict(user)
+        await cls.cache.set(user.id, public_user(created))
+        await cls.auth_cache.invalidate(username)
+        return created
+
+    # Многострочный INSERT ... ON CONFLICT DO NOTHING RETURNING чанками по bulk_chunk_size строк,
+    # одна транзакция на чанк. Строки с занятым username или email (в БД или раньше в том же запросе) пропускаются
+    # и возвращаются со статусом conflict, остальные вставляются. Прочая ошибка откатывает только свой чанк.
+    @classmethod
+    @async_db_session_method
+    async def add_users(cls, db: AsyncSession, users: list[dict]) -> list[BulkItemResult]:
+        results = []
+        for start in range(0, len(users), cls.bulk_chunk_size):
+            chunk = users[start:start + cls.bulk_chunk_size]
+            statement = dialect_insert(cls.engine.dialect.name, UserTable).on_conflict_do_nothing().returning(
+                UserTable.id, UserTable.username, UserTable.email
+            )
+            try:
+                created = {(username, email): pk for pk, username, email in (await db.execute(statement, chunk)).all()}
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                results.extend(BulkItemResult(index=start + i, status='error', detail=str(e.__class__.__name__))
+                               for i in range(len(chunk)))
+                continue
+            for i, user in enumerate(chunk):
+                # вставленная строка - первая с такими username и email; повторы в запросе тоже конфликт
+                pk = created.pop((user['username'], user['email']), None)
+                if pk is None:
+                    results.append(BulkItemResult(index=start + i, status='conflict',
+                                                  detail='Username or email already exists'))
+                else:
+                    results.append(BulkItemResult(index=start + i, id=pk, status='created'))
+        return results
+
+    @classmethod
+    @async_db_session_method
+    async def update_user(cls, db: AsyncSession, pk: int, **fields) -> dict | None:
+        old_username = await db.scalar(select(UserTable.username).where(UserTable.id == pk))
+        if old_username is None:
+            return None
+        user = await db.scalar(update(UserTable).where(UserTable.id == pk).values(**fields).returning(UserTable))
+        await db.commit()
+        updated = user_to_dict(user)
+        await cls.cache.set(pk, public_user(updated))
+        await cls.auth_cache.invalidate(old_username)
+        await cls.auth_cache.invalidate(updated['username'])
+        if updated['disabled'] or updated['username'] != old_username:
+            await cls._access_revoked(old_username)
+        return updated
+
+    @classmethod
+    async def update_user_by_username(cls, username: str, **fields) -> dict | None:
+        user = await cls._fetch_by_username(username)
+        if user is None:
+            return None
+        return await cls.update_user(user['id'], **fields)
+
+    @classmethod
+    @async_db_session_method
+    async def delete_user(cls, db: AsyncSession, pk: int) -> bool:
+        username = await db.scalar(delete(UserTable).where(UserTable.id == pk).returning(UserTable.username))
+        await db.commit()
+        await cls.cache.invalidate(pk)
+        if username is None:
+            return False
+        await cls.auth_cache.invalidate(username)
+        await cls._access_revoked(username)
+        return True
+
+    # демо-пользователи из README создаются, если их еще нет
+    @classmethod
+    @async_db_session_method
+    async def seed_users(cls, db: AsyncSession, users: list[dict]):
+        existing = set((await db.scalars(
+            select(UserTable.username).where(UserTable.username.in_([user['username'] for user in users]))
+        )).all())
+        db.add_all(UserTable(**user) for user in users if user['username'] not in existing)
+        await db.commit()
+
+    @classmethod
+    @asynccontextmanager
+    async def get_db_session(cls):
+        db = cls.session()
+        try:
+            started = time.perf_counter()
+            await db.connection()
+            pool_stats.observe_wait(time.perf_counter() - started)
+            yield db
+        finally:
+            await db.close()
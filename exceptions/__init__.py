@@ -5,9 +5,24 @@ __all__ = (
     'custom_exception_c_handler',
     'custom_http_exception_handler',
     'custom_request_validation_exception_handler',
-    'value_error_handler'
+    'value_error_handler',
+    'unauthed_exc',
+    'inactive_exc',
+    'incorrect_access_rights',
+    'hasher_overloaded_exc',
+    'idempotency_conflict_exc',
+    'raise_not_exist',
+    'raise_too_many_requests',
+    'ErrorResponseRegistry',
+    'LogSampler',
+    'PrecomputedResponse',
+    'STATIC_HTTP_EXCEPTIONS',
+    'validation_errors_response'
 )
 
 from exceptions.custom import CustomExceptionA, CustomExceptionB, CustomExceptionC
 from exceptions.handlers import custom_exception_c_handler, custom_http_exception_handler, \
-    custom_request_validation_exception_handler, value_error_handler
+    custom_request_validation_exception_handler, value_error_handler, STATIC_HTTP_EXCEPTIONS
+from exceptions.responses import ErrorResponseRegistry, LogSampler, PrecomputedResponse, validation_errors_response
+from exceptions.variables import unauthed_exc, inactive_exc, incorrect_access_rights, hasher_overloaded_exc, \
+    idempotency_conflict_exc, raise_not_exist, raise_too_many_requests
@@ -1,7 +1,16 @@
+import logging
+
 from fastapi import Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 
+from exceptions.custom import CustomExceptionA, CustomExceptionB, CustomExceptionC
+from exceptions.responses import ErrorResponseRegistry, LogSampler, validation_errors_response
+from exceptions.variables import hasher_overloaded_exc, inactive_exc, incorrect_access_rights, unauthed_exc
+
+logger = logging.getLogger(__name__)
+log_sampler = LogSampler(logger, per_second=1)
+
 
 class ErrorResponseModel(BaseModel):
     status_code: str
@@ -10,31 +19,39 @@ class ErrorResponseModel(BaseModel):
     additional: str
 
 
-def custom_exception_c_handler(request: Request, exc: Exception | ErrorResponseModel):
-    print("Произошла ошибка. Нужно проверить лог")
-    return JSONResponse(
-        content={
-            "status_code": int(exc.status_code),
-            "detail": exc.detail,
-            "description": exc.description,
-            "additional": exc.additional,
-        },
-    )
+STATIC_HTTP_EXCEPTIONS = (unauthed_exc, inactive_exc, incorrect_access_rights, hasher_overloaded_exc)
+
+# готовые ответы для исключений с неизменным содержимым, отдельно под формат каждого обработчика
+custom_exception_c_responses = ErrorResponseRegistry(
+    lambda exc: {
+        "status_code": int(exc.status_code),
+        "detail": exc.detail,
+        "description": exc.description,
+        "additional": exc.additional,
+    },
+    status=lambda exc: 200,
+).register(CustomExceptionC())
+
+http_exception_responses = ErrorResponseRegistry(
+    lambda exc: {"error": str(exc)}
+).register(*STATIC_HTTP_EXCEPTIONS, CustomExceptionA(), CustomExceptionB(), CustomExceptionC())
+
+
+async def custom_exception_c_handler(request: Request, exc: Exception | ErrorResponseModel):
+    log_sampler.log(logging.WARNING, 'custom_exception_c', "Произошла ошибка. Нужно проверить лог")
+    return custom_exception_c_responses.response(exc)
 
 
 # обработчик всех исключений типа HTTPException
 async def custom_http_exception_handler(request, exc):
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={"error": str(exc)},
-    )
+    return http_exception_responses.response(exc)
 
 
 # обработчик ошибок синтаксиса в теле запроса - тип RequestValidationError ( Pydantic 422 Unprocessable Entity )
 async def custom_request_validation_exception_handler(request, exc):
-    return JSONResponse(
-        status_code=422,
-        content={"message": "Custom Request Validation Error", "errors": exc.errors()},
+    return validation_errors_response(
+        exc.errors(), status_code=422,
+        wrap=lambda errors: {"message": "Custom Request Validation Error", "errors": errors},
     )
 
 
@@ -5,12 +5,16 @@ from fastapi import HTTPException, FastAPI
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, field_validator
 from starlette.requests import Request
-from starlette.responses import JSONResponse
 
 from exceptions import CustomExceptionA, CustomExceptionB, CustomExceptionC, custom_exception_c_handler, \
-    custom_http_exception_handler, custom_request_validation_exception_handler, value_error_handler
+    custom_http_exception_handler, custom_request_validation_exception_handler, value_error_handler, \
+    ErrorResponseRegistry
+from metrics import InstrumentedJSONResponse, instrument
+from serialization import use_fast_json
 
-app = FastAPI()
+app = FastAPI(default_response_class=InstrumentedJSONResponse)
+instrument(app)
+use_fast_json(app)
 
 # Обработчики исключений
 app.add_exception_handler(CustomExceptionC, custom_exception_c_handler)
@@ -26,20 +30,23 @@ app.add_exception_handler(ValueError, value_error_handler)
 #         content={"error": "Bad request"}
 #     )
 
+custom_exception_a_responses = ErrorResponseRegistry(
+    lambda exc: {"status_code": exc.status_code, "error": exc.detail, 'info': exc.description}
+).register(CustomExceptionA())
+
+custom_exception_b_responses = ErrorResponseRegistry(
+    lambda exc: {"error": exc.detail, 'description': exc.description}
+).register(CustomExceptionB())
+
+
 @app.exception_handler(CustomExceptionA)
 async def custom_exception_a_handler(request: Request, exc: CustomExceptionA):
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={"status_code": exc.status_code, "error": exc.detail, 'info': exc.description}
-    )
+    return custom_exception_a_responses.response(exc)
 
 
 @app.exception_handler(CustomExceptionB)
 async def custom_exception_b_handler(request: Request, exc: CustomExceptionB):
-    return JSONResponse(
-        status_code=exc.status_code,
-        content={"error": exc.detail, 'description': exc.description}
-    )
+    return custom_exception_b_responses.response(exc)
 
 
 @app.get("/root")
@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+
+from starlette.responses import JSONResponse, Response
+
+
+# Ответ с заранее сериализованным телом и заголовками - на запросе ничего не кодируется
+class PrecomputedResponse(Response):
+    def __init__(self, status_code: int, body: bytes, raw_headers: list[tuple[bytes, bytes]]):
+        self.status_code = status_code
+        self.body = body
+        self.background = None
+        # копия, т.к. middleware могут дописывать заголовки в ответ
+        self.raw_headers = list(raw_headers)
+
+
+def _exception_key(exc):
+    headers = getattr(exc, 'headers', None)
+    return (
+        type(exc),
+        getattr(exc, 'status_code', None),
+        getattr(exc, 'detail', None),
+        getattr(exc, 'description', None),
+        getattr(exc, 'additional', None),
+        tuple(sorted(headers.items())) if headers else None,
+    )
+
+
+# Реестр готовых ответов на статические исключения. render(exc) задает формат тела конкретного обработчика,
+# поэтому у каждого обработчика свой реестр. Исключения, которых нет в реестре, сериализуются как обычно.
+class ErrorResponseRegistry:
+    def __init__(self, render, status=lambda exc: exc.status_code):
+        self.render = render
+        self.status = status
+        self._responses: dict[tuple, tuple[int, bytes, list[tuple[bytes, bytes]]]] = {}
+
+    def register(self, *excs):
+        for exc in excs:
+            template = JSONResponse(self.render(exc), status_code=self.status(exc),
+                                    headers=getattr(exc, 'headers', None))
+            self._responses[_exception_key(exc)] = (template.status_code, template.body, template.raw_headers)
+        return self
+
+    def response(self, exc) -> Response:
+        try:
+            precomputed = self._responses.get(_exception_key(exc))
+        except TypeError:
+            # нехешируемый detail (dict, list) - такие ответы не кешируются
+            precomputed = None
+        if precomputed is not None:
+            return PrecomputedResponse(*precomputed)
+        return JSONResponse(self.render(exc), status_code=self.status(exc), headers=getattr(exc, 'headers', None))
+
+
+# Ошибки валидации: тело собирается одним json.dumps, без jsonable_encoder;
+# непредставимые в JSON значения (bytes и т.п.) превращаются в строку
+def validation_errors_response(errors, status_code: int = 422, wrap=None) -> Response:
+    content = wrap(errors) if wrap is not None else errors
+    body = json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    return Response(body, status_code=status_code, media_type='application/json')
+
+
+# Логирование с ограничением: не больше per_second сообщений в секунду на ключ,
+# остальные только считаются и выводятся числом в следующем записанном сообщении
+class LogSampler:
+    def __init__(self, logger, per_second: float = 1.0):
+        self.logger = logger
+        self.per_second = per_second
+        self._state: dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def log(self, level: int, key: str, msg: str, *args):
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                state = self._state[key] = [0.0, 0]
+            if now - state[0] < 1 / self.per_second:
+                state[1] += 1
+                return
+            suppressed = state[1]
+            state[0], state[1] = now, 0
+        if not self.logger.isEnabledFor(level):
+            return
+        if suppressed:
+            msg = f'{msg} (+{suppressed} similar suppressed)'
+        self.logger.log(level, msg, *args)
@@ -1,3 +1,5 @@
+import math
+
 from fastapi import HTTPException
 from starlette import status
 
@@ -16,6 +18,26 @@ incorrect_access_rights = HTTPException(
     detail="Not correct access rights"
 )
 
+# ключ идемпотентности уже привязан к другой задаче (PUT /get-or-create-todo/{pk} с чужим ключом)
+idempotency_conflict_exc = HTTPException(
+    status_code=status.HTTP_409_CONFLICT,
+    detail='Idempotency-Key is already used by another todo'
+)
+
+hasher_overloaded_exc = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail='Too many login attempts in progress, try again later',
+    headers={'Retry-After': '1'}
+)
+
+
+def raise_too_many_requests(retry_after: float):
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail='Too many login attempts, try again later',
+        headers={'Retry-After': str(max(1, math.ceil(retry_after)))}
+    )
+
 
 def raise_not_exist(pk: int):
     raise HTTPException(
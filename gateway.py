@@ -0,0 +1,123 @@
+import inspect
+from contextlib import AsyncExitStack, asynccontextmanager
+
+import uvicorn
+from fastapi import Depends, FastAPI, Request
+from fastapi.routing import APIRoute
+
+import main
+import todo_app
+import users_app
+from exceptions.main import app as exceptions_app
+from metrics import InstrumentedJSONResponse, instrument
+from serialization import use_fast_json
+
+# Все приложения в одном процессе: пулы БД, кеши и метрики у них и так общие на процесс (get_engine/
+# get_async_engine, ReadThroughCache в *Tools, registry), здесь они обслуживаются одним event loop и портом.
+# (приложение, префикс, зависимости): роуты todo и users закрыты RBAC-политикой из policy.json
+APPS = (
+    (main.app, '', ()),
+    (todo_app.app, '/todo_app', (Depends(main.authorize),)),
+    (users_app.app, '/users_app', (Depends(main.authorize),)),
+    (exceptions_app, '/exceptions', ()),
+)
+
+# id роута шлюза -> приложение, из которого он взят; по нему выбираются обработчики исключений
+route_apps: dict[int, FastAPI] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # у подключенных приложений свои lifespan (создание таблиц, сиды, наблюдатели за политикой и ключами)
+    async with AsyncExitStack() as stack:
+        for sub_app, _, _ in APPS:
+            await stack.enter_async_context(sub_app.router.lifespan_context(sub_app))
+        yield
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=InstrumentedJSONResponse)
+# /metrics отдает статистику пулов БД, кешей и лимитеров - доступ как к /todo_app/pool_stats (ops:read)
+instrument(app, dependencies=[Depends(main.authorize)])
+use_fast_json(app)
+default_exception_handlers = dict(app.exception_handlers)
+
+
+# для server.run: подготовка всех приложений до fork и их состояние в памяти процесса
+async def prepare():
+    for sub_app, _, _ in APPS:
+        sub_prepare = getattr(sub_app.state, 'prepare', None)
+        if sub_prepare is not None:
+            await sub_prepare()
+
+
+app.state.prepare = prepare
+app.state.process_local_state = [name for sub_app, _, _ in APPS
+                                 for name in getattr(sub_app.state, 'process_local_state', ())]
+
+
+# Роуты копируются в роутер шлюза с префиксом (без Mount): один стек middleware и одна маршрутизация на запрос,
+# а route.path содержит префикс - по нему authorize находит правило в policy.json.
+# Документация и /metrics приложений не переносятся - у шлюза они свои.
+def include_app(sub_app: FastAPI, prefix: str, dependencies):
+    for route in sub_app.routes:
+        if not isinstance(route, APIRoute) or not route.include_in_schema:
+            continue
+        app.router.add_api_route(
+            prefix + route.path,
+            route.endpoint,
+            response_model=route.response_model,
+            status_code=route.status_code,
+            tags=route.tags,
+            dependencies=[*dependencies, *route.dependencies],
+            summary=route.summary,
+            description=route.description,
+            response_description=route.response_description,
+            responses=route.responses,
+            deprecated=route.deprecated,
+            methods=route.methods,
+            operation_id=route.operation_id,
+            response_model_include=route.response_model_include,
+            response_model_exclude=route.response_model_exclude,
+            response_model_by_alias=route.response_model_by_alias,
+            response_model_exclude_unset=route.response_model_exclude_unset,
+            response_model_exclude_defaults=route.response_model_exclude_defaults,
+            response_model_exclude_none=route.response_model_exclude_none,
+            include_in_schema=route.include_in_schema,
+            response_class=route.response_class,
+            name=route.name,
+            route_class_override=type(route),
+            callbacks=route.callbacks,
+            openapi_extra=route.openapi_extra,
+        )
+        route_apps[id(app.router.routes[-1])] = sub_app
+
+
+def find_handler(handlers: dict, exc: Exception):
+    for cls in type(exc).__mro__:
+        if cls in handlers:
+            return handlers[cls]
+    return None
+
+
+# Исключение обрабатывается так же, как в исходном приложении роута: у todo_app свой формат 400,
+# у exceptions.main - свои обработчики. Для роутов самого шлюза - обработчики FastAPI по умолчанию.
+async def dispatch_exception(request: Request, exc: Exception):
+    sub_app = route_apps.get(id(request.scope.get('route')))
+    handler = find_handler(sub_app.exception_handlers if sub_app else default_exception_handlers, exc)
+    if handler is None:
+        raise exc
+    response = handler(request, exc)
+    if inspect.isawaitable(response):
+        response = await response
+    return response
+
+
+for sub_app, prefix, dependencies in APPS:
+    include_app(sub_app, prefix, dependencies)
+    for exc_class in sub_app.exception_handlers:
+        if exc_class not in (Exception, 500):
+            app.add_exception_handler(exc_class, dispatch_exception)
+
+
+if __name__ == '__main__':
+    uvicorn.run('gateway:app', reload=True)
@@ -1,24 +1,36 @@
 # module for RBAC app
+import asyncio
+import secrets
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from enum import Enum
 from typing import Annotated
 
 import uvicorn
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import BackgroundTasks, Depends, FastAPI, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from pydantic import BaseModel
 
-from exceptions import incorrect_access_rights, inactive_exc
+from auth import KeyRing, LoginRateLimiter, PasswordHasher, PolicyEngine, Principal, RateLimited, RefreshTokenError, \
+    RefreshTokenStore, RevocationList, SharedRefreshTokenStore, SharedRevocationList, TokenCache, auth_settings, \
+    build_crypt_context, route_key
+from cache import cache_settings, create_backend
+from db.users import AsyncUserTools
+from exceptions import incorrect_access_rights, inactive_exc, raise_too_many_requests, ErrorResponseRegistry, \
+    STATIC_HTTP_EXCEPTIONS
+from metrics import InstrumentedJSONResponse, instrument, registry, timed
+from serialization import use_fast_json
 
 # to get a string like this run:
 # openssl rand -hex 32
 SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = auth_settings.ACCESS_TOKEN_EXPIRE_MINUTES
+REFRESH_TOKEN_EXPIRE_DAYS = auth_settings.REFRESH_TOKEN_EXPIRE_DAYS
 
-fake_users_db = {
+# демо-пользователи из README, создаются в таблице users при старте, если их там нет
+demo_users = {
     "johndoe": {
         "username": "johndoe",
         "full_name": "John Doe",
@@ -50,6 +62,11 @@ fake_users_db = {
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
@@ -74,11 +91,87 @@ class UserInDB(User):
     hashed_password: str
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = build_crypt_context(
+    scheme=auth_settings.PWD_SCHEME,
+    bcrypt_rounds=auth_settings.PWD_BCRYPT_ROUNDS,
+    argon2_time_cost=auth_settings.PWD_ARGON2_TIME_COST,
+    argon2_memory_cost=auth_settings.PWD_ARGON2_MEMORY_COST,
+    argon2_parallelism=auth_settings.PWD_ARGON2_PARALLELISM,
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-app = FastAPI()
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=auth_settings.PWD_HASH_WORKERS,
+    max_queue=auth_settings.PWD_HASH_QUEUE,
+    executor=auth_settings.PWD_HASH_EXECUTOR,
+)
+
+login_limiter = LoginRateLimiter(
+    create_backend(auth_settings.LOGIN_LIMITER_BACKEND, cache_settings.CACHE_URL, auth_settings.LOGIN_LIMITER_MAX_KEYS),
+    user_rate=auth_settings.LOGIN_USER_PER_MINUTE / 60,
+    user_burst=auth_settings.LOGIN_USER_BURST,
+    ip_rate=auth_settings.LOGIN_IP_PER_MINUTE / 60,
+    ip_burst=auth_settings.LOGIN_IP_BURST,
+    lockout_threshold=auth_settings.LOGIN_LOCKOUT_THRESHOLD,
+    lockout_base=auth_settings.LOGIN_LOCKOUT_BASE_SECONDS,
+    lockout_max=auth_settings.LOGIN_LOCKOUT_MAX_SECONDS,
+)
+
+token_cache = TokenCache(max_size=auth_settings.TOKEN_CACHE_SIZE)
+
+# Отзывы access-токенов и refresh-токены: в памяти процесса или, для нескольких воркеров, в общем бэкенде
+if auth_settings.AUTH_STATE_BACKEND == 'memory':
+    revoked_tokens = RevocationList(capacity=auth_settings.REVOCATION_CAPACITY)
+    refresh_tokens = RefreshTokenStore(
+        ttl_seconds=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS).total_seconds(),
+        max_size=auth_settings.REFRESH_TOKEN_STORE_SIZE,
+    )
+else:
+    auth_state_backend = create_backend(auth_settings.AUTH_STATE_BACKEND, cache_settings.CACHE_URL)
+    revoked_tokens = SharedRevocationList(auth_state_backend)
+    refresh_tokens = SharedRefreshTokenStore(
+        auth_state_backend, ttl_seconds=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS).total_seconds()
+    )
+
+# в asymmetric-режиме токены подписываются активным ключом из набора, проверяются по kid
+key_ring = None
+if auth_settings.JWT_MODE == 'asymmetric':
+    key_ring = KeyRing(auth_settings.JWT_KEYS_DIR, token_lifetime=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+# политика компилируется в битовые маски при старте, дальше перечитывается при изменении файла
+policy_engine = PolicyEngine(auth_settings.RBAC_POLICY_FILE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await prepare()
+    watchers = []
+    if auth_settings.RBAC_POLICY_RELOAD_INTERVAL > 0:
+        watchers.append(asyncio.create_task(policy_engine.watch(auth_settings.RBAC_POLICY_RELOAD_INTERVAL)))
+    if key_ring is not None and auth_settings.JWT_KEYS_REFRESH_INTERVAL > 0:
+        watchers.append(asyncio.create_task(key_ring.watch(auth_settings.JWT_KEYS_REFRESH_INTERVAL)))
+    yield
+    for watcher in watchers:
+        watcher.cancel()
+    password_hasher.shutdown()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=InstrumentedJSONResponse)
+use_fast_json(app)
+# для server.run: состояние в памяти процесса, с ним приложение нельзя запускать в нескольких воркерах
+app.state.process_local_state = [name for name, backend in (
+    ('AUTH_STATE_BACKEND', auth_settings.AUTH_STATE_BACKEND),
+    ('LOGIN_LIMITER_BACKEND', auth_settings.LOGIN_LIMITER_BACKEND),
+) if backend == 'memory']
+registry.register_collector('password_hasher', password_hasher.stats.snapshot)
+registry.register_collector('token_cache', token_cache.stats)
+registry.register_collector('revoked_tokens', revoked_tokens.stats)
+registry.register_collector('login_limiter', login_limiter.stats)
+registry.register_collector('user_auth_cache', AsyncUserTools.auth_cache.stats)
+# удаление, блокировка или переименование пользователя (в т.ч. через users_app) отзывает его refresh-токены
+AsyncUserTools.on_access_revoked(refresh_tokens.revoke_user)
 
 
 def verify_password(plain_password, hashed_password):
@@ -89,18 +182,55 @@ def get_password_hash(password: str):
     return pwd_context.hash(password)
 
 
-def get_user(username: str) -> UserInDB:
-    if username in fake_users_db:
-        user_dict = fake_users_db[username]
+async def get_user(username: str) -> UserInDB | None:
+    user_dict = await AsyncUserTools.get_by_username(username)
+    # пользователи без пароля (созданные через users_app) не участвуют в аутентификации
+    if user_dict and user_dict['hashed_password']:
         return UserInDB(**user_dict)
 
 
-def authenticate_user(fake_db, username: str, password: str):
-    user = get_user(username)
+# хеш для проверки пароля несуществующего пользователя, чтобы ответ занимал столько же времени
+_dummy_password_hash = None
+
+
+async def get_dummy_password_hash() -> str:
+    global _dummy_password_hash
+    if _dummy_password_hash is None:
+        _dummy_password_hash = await password_hasher.hash(secrets.token_urlsafe(16))
+    return _dummy_password_hash
+
+
+# Одноразовая подготовка: таблицы, демо-пользователи, хеш-заглушка. server.run выполняет ее в родителе до fork,
+# и lifespan воркеров ее пропускает - иначе воркеры на пустой БД гоняются на create_all и сидах.
+# Хеш считается здесь же, без пула password_hasher: потоки пула не переживают fork.
+prepared = False
+
+
+async def prepare():
+    global prepared, _dummy_password_hash
+    if prepared:
+        return
+    await AsyncUserTools.create_tables()
+    await AsyncUserTools.seed_users(list(demo_users.values()))
+    if _dummy_password_hash is None:
+        _dummy_password_hash = pwd_context.hash(secrets.token_urlsafe(16))
+    prepared = True
+
+
+app.state.prepare = prepare
+
+
+async def authenticate_user(username: str, password: str, background_tasks: BackgroundTasks | None = None):
+    user = await get_user(username)
     if not user:
+        await password_hasher.verify(password, await get_dummy_password_hash())
         return False
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not verified:
         return False
+    # хеш устарел (другая схема или стоимость) - сохраняем пересчитанный уже после ответа клиенту
+    if new_hash is not None and background_tasks is not None:
+        background_tasks.add_task(AsyncUserTools.update_user_by_username, username, hashed_password=new_hash)
     return user
 
 
@@ -110,29 +240,71 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.now(timezone.utc) + expires_delta
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    # jti - идентификатор токена, по нему токен можно отозвать до истечения exp
+    to_encode.update({"exp": expire, "jti": secrets.token_urlsafe(16)})
+    encoded_jwt = encode_token(to_encode)
     return encoded_jwt
 
 
-async def get_current_user_from_token(token: Annotated[str, Depends(oauth2_scheme)]) -> UserInDB:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+def encode_token(claims: dict) -> str:
+    if key_ring is not None:
+        return key_ring.encode(claims)
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_token(token: str) -> dict:
+    if key_ring is not None:
+        return key_ring.decode(token)
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+# 401/403 на каждый неудачный запрос отдаются готовыми байтами, формат тот же, что у FastAPI по умолчанию
+auth_error_responses = ErrorResponseRegistry(
+    lambda exc: {"detail": exc.detail}
+).register(*STATIC_HTTP_EXCEPTIONS, credentials_exception)
+
+
+@app.exception_handler(HTTPException)
+async def http_exception_handler(request: Request, exc: HTTPException):
+    return auth_error_responses.response(exc)
+
+
+# Проверенный токен: (пользователь, jti, exp). В кеше до exp лежит только (username, jti, exp) - результат
+# проверки подписи; пользователь берется на каждом запросе из AsyncUserTools.get_by_username, кеш которого
+# сбрасывается при любой записи, так что удаление, блокировка или смена роли действуют сразу.
+async def get_verified_token(token: Annotated[str, Depends(oauth2_scheme)]) -> tuple[UserInDB, str | None, float]:
+    verified = token_cache.get(token)
+    if verified is None:
+        try:
+            with timed('jwt_decode'):
+                payload = decode_token(token)
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+            token_data = TokenData(username=username)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
+        verified = (token_data.username, payload.get("jti"), payload["exp"])
+        token_cache.put(token, verified, exp=payload["exp"])
+    username, jti, exp = verified
+    if await revoked_tokens.is_revoked(jti):
         raise credentials_exception
-    user = get_user(username=token_data.username)
+    user = await get_user(username=username)
     if user is None:
         raise credentials_exception
-    return user
+    return user, jti, exp
+
+
+async def get_current_user_from_token(
+        verified: Annotated[tuple[UserInDB, str | None, float], Depends(get_verified_token)]
+) -> UserInDB:
+    return verified[0]
 
 
 async def get_current_active_user(current_user: Annotated[User, Depends(get_current_user_from_token)]):
@@ -141,20 +313,100 @@ async def get_current_active_user(current_user: Annotated[User, Depends(get_curr
     return current_user
 
 
+# пользователь запроса резолвится один раз и переиспользуется всеми зависимостями и обработчиком
+async def get_principal(request: Request,
+                        current_user: Annotated[UserInDB, Depends(get_current_user_from_token)]) -> Principal:
+    principal = getattr(request.state, 'principal', None)
+    if principal is None:
+        if current_user.disabled:
+            raise inactive_exc
+        principal = Principal(current_user)
+        request.state.principal = principal
+    return principal
+
+
+# проверка по скомпилированной политике: маска роли & маска роута
+async def authorize(request: Request, principal: Annotated[Principal, Depends(get_principal)]) -> Principal:
+    policy = policy_engine.policy
+    required = policy.route_masks.get(route_key(request.method, request.scope['route'].path))
+    if required is None or not policy.allows(principal.role.value, required):
+        raise incorrect_access_rights
+    return principal
+
+
+# /metrics отдает статистику хешера, лимитера, кешей и пулов - только с ops:read, как в шлюзе
+instrument(app, dependencies=[Depends(authorize)])
+
+
 @app.post("/token")
-async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token:
-    user = authenticate_user(fake_users_db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
+                                 request: Request, background_tasks: BackgroundTasks) -> Token:
+    # лимиты проверяются до дорогой проверки пароля
+    try:
+        await login_limiter.check(form_data.username, request.client.host if request.client else None)
+    except RateLimited as e:
+        raise_too_many_requests(e.retry_after)
+    user = await authenticate_user(form_data.username, form_data.password, background_tasks)
     if not user:
+        await login_limiter.register_failure(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    await login_limiter.register_success(form_data.username)
+    return await issue_tokens(user.username)
+
+
+async def issue_tokens(username: str, refresh_token: str | None = None) -> Token:
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": username}, expires_delta=access_token_expires
+    )
+    if refresh_token is None:
+        refresh_token = await refresh_tokens.issue(username)
+    return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
+
+
+# новый access-токен по refresh-токену, без проверки пароля; refresh-токен при этом меняется на новый
+@app.post("/token/refresh")
+async def refresh_access_token(body: RefreshRequest) -> Token:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
     )
-    return Token(access_token=access_token, token_type="bearer")
+    try:
+        username, new_refresh_token = await refresh_tokens.rotate(body.refresh_token)
+    except RefreshTokenError:
+        raise credentials_exception
+    user = await get_user(username)
+    if user is None or user.disabled:
+        await refresh_tokens.revoke(new_refresh_token)
+        raise credentials_exception
+    return await issue_tokens(username, refresh_token=new_refresh_token)
+
+
+# отзыв текущего access-токена до истечения его exp
+@app.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(verified: Annotated[tuple[UserInDB, str | None, float], Depends(get_verified_token)]):
+    user, jti, exp = verified
+    if jti is not None:
+        await revoked_tokens.revoke(jti, exp)
+
+
+# отзыв refresh-токена (logout): перестают работать он и все токены, полученные из него
+@app.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_refresh_token(body: RefreshRequest):
+    await refresh_tokens.revoke(body.refresh_token)
+
+
+# публичные ключи для проверки токенов другими сервисами; в symmetric-режиме набор пуст
+@app.get("/.well-known/jwks.json")
+async def get_jwks():
+    if key_ring is None:
+        return {"keys": []}
+    return key_ring.jwks
 
 
 @app.get("/info", response_model=User)
@@ -164,43 +416,26 @@ async def read_users_me(current_user: Annotated[User, Depends(get_current_active
 
 # Защищенный роут только для админов, когда токен уже получен
 @app.get("/admin")
-def get_admin_info(current_user: str = Depends(get_current_user_from_token)):
-    user_data = get_user(current_user.username)
-    # print(user_data)
-    # print(type(user_data))
-    if user_data.role.value != "admin":
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not correct access rights")
+async def get_admin_info(principal: Annotated[Principal, Depends(authorize)]):
     return {"message": "Welcome Admin!"}
 
 
 # роут только для юзеров, когда токен получен
 @app.get("/user")
-def get_user_info(current_user: str = Depends(get_current_user_from_token)):
-    user_data = get_user(current_user.username)
-    # print(user_data)
-    # print(type(user_data))
-    if user_data.role.value != "user":
-        raise incorrect_access_rights
+async def get_user_info(principal: Annotated[Principal, Depends(authorize)]):
     return {"message": "Welcome User!"}
 
 
 # роут для юзеров и админов когда токен получен
 @app.get('/protected_resource')
-def get_protected_resource(current_user: str = Depends(get_current_user_from_token)):
-    user_data = get_user(current_user.username)
-    if user_data.role.value not in [Role.ADMIN.value, Role.USER.value]:
-        raise incorrect_access_rights
+async def get_protected_resource(principal: Annotated[Principal, Depends(authorize)]):
     return {"message": "Welcome to protected resource!"}
 
 
 # роут для авторизованных пользователей
 @app.get('/resource_for_authorized')
-def get_resource_for_authorized(current_user: str = Depends(get_current_user_from_token)):
-    user_data = get_user(current_user.username)
-    if user_data.role.value in [Role.ADMIN.value, Role.USER.value, Role.GUEST.value]:
-        return {"message": "Welcome to resource for authorized users!"}
-    else:
-        raise incorrect_access_rights
+async def get_resource_for_authorized(principal: Annotated[Principal, Depends(authorize)]):
+    return {"message": "Welcome to resource for authorized users!"}
 
 
 # роут для всех, включая неавторизованных
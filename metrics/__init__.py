@@ -0,0 +1,16 @@
+__all__ = (
+    'Histogram',
+    'Registry',
+    'registry',
+    'REQUEST_LATENCY',
+    'PHASE_LATENCY',
+    'InstrumentedJSONResponse',
+    'MetricsMiddleware',
+    'instrument',
+    'observe_phase',
+    'timed',
+)
+
+from metrics.instrumentation import PHASE_LATENCY, REQUEST_LATENCY, InstrumentedJSONResponse, MetricsMiddleware, \
+    instrument, observe_phase, timed
+from metrics.registry import Histogram, Registry, registry
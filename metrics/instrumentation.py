@@ -0,0 +1,77 @@
+import time
+from contextlib import contextmanager
+
+from fastapi import FastAPI
+from starlette.responses import JSONResponse, PlainTextResponse
+
+from metrics.registry import registry
+
+REQUEST_LATENCY = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('method', 'route', 'status')
+)
+# jwt_decode, password_hash, password_queue_wait, db_checkout, db_query, serialization
+PHASE_LATENCY = registry.histogram('app_phase_duration_seconds', 'Time spent in hot-path phases', ('phase',))
+
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        PHASE_LATENCY.observe(time.perf_counter() - started, phase)
+
+
+def observe_phase(phase: str, seconds: float):
+    PHASE_LATENCY.observe(seconds, phase)
+
+
+# Чистый ASGI middleware (без BaseHTTPMiddleware), чтобы не добавлять лишний таск на каждый запрос.
+# Роут берется из scope после маршрутизации - в метках шаблон пути, а не конкретный URL.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status_holder[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get('route')
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - started,
+                scope['method'],
+                route.path if route is not None else 'unmatched',
+                status_holder[0],
+            )
+
+
+# JSONResponse, который учитывает время сериализации тела
+class InstrumentedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = super().render(content)
+        PHASE_LATENCY.observe(time.perf_counter() - started, 'serialization')
+        return body
+
+
+async def metrics_endpoint():
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
+
+
+# dependencies - например, проверка доступа к /metrics
+def instrument(app: FastAPI, dependencies=None) -> FastAPI:
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route('/metrics', metrics_endpoint, methods=['GET'], include_in_schema=False,
+                      dependencies=dependencies)
+    return app
@@ -0,0 +1,84 @@
+import math
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# Гистограмма с фиксированными бакетами. Без блокировок: observe вызывается на каждом запросе,
+# а редкие гонки между потоками для метрик не критичны.
+class Histogram:
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            # counts по бакетам + бакет +Inf, затем сумма и количество
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total, count) in list(self._series.items()):
+            labels = [f'{k}="{v}"' for k, v in zip(self.label_names, label_values)]
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == math.inf else repr(bound)
+                bucket_labels = ','.join(labels + [f'le="{le}"'])
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            suffix = f'{{{",".join(labels)}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {total}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return lines
+
+
+def _flatten(prefix: str, values: dict) -> list[tuple[str, float]]:
+    samples = []
+    for key, value in values.items():
+        name = f'{prefix}_{key}'
+        if isinstance(value, dict):
+            samples.extend(_flatten(name, value))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            samples.append((name, value))
+    return samples
+
+
+class Registry:
+    def __init__(self):
+        self._histograms: dict[str, Histogram] = {}
+        self._collectors: dict[str, object] = {}
+
+    def histogram(self, name: str, help_text: str, label_names: tuple[str, ...] = (),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        if name not in self._histograms:
+            self._histograms[name] = Histogram(name, help_text, label_names, buckets)
+        return self._histograms[name]
+
+    # collector - функция без аргументов, возвращающая dict со статистикой (например, stats() кешей);
+    # числовые значения отдаются как gauge с префиксом
+    def register_collector(self, prefix: str, collector):
+        self._collectors[prefix] = collector
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self._histograms.values():
+            lines.extend(histogram.render())
+        for prefix, collector in self._collectors.items():
+            try:
+                values = collector()
+            except Exception:
+                continue
+            for name, value in _flatten(prefix, values):
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
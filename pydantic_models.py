@@ -55,3 +55,20 @@ class TodoPayload(BaseModel):
 
 class Todo(TodoPayload):
     id: int | None = None
+
+
+class TodoPage(BaseModel):
+    items: list[Todo]
+    # id для сортировок по id, строка для сортировок по title
+    next_cursor: int | str | None = None
+
+
+class TodoBulkUpdate(TodoPayload):
+    id: int
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: int | None = None
+    status: str
+    detail: str | None = None
@@ -0,0 +1,12 @@
+__all__ = (
+    'FastJSONResponse',
+    'FastJSONRoute',
+    'SerializationSettings',
+    'dumps',
+    'serialization_settings',
+    'set_fast_json',
+    'use_fast_json',
+)
+
+from serialization.config import SerializationSettings, serialization_settings
+from serialization.responses import FastJSONResponse, FastJSONRoute, dumps, set_fast_json, use_fast_json
@@ -0,0 +1,17 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+dotenv_path = Path(__file__).parent.parent / '.env'
+
+load_dotenv(dotenv_path=dotenv_path)
+
+
+class SerializationSettings:
+    # true - все роуты приложения отдают JSON быстрым путем (FastJSONRoute), false - только роуты,
+    # где явно указан response_class=FastJSONResponse
+    FAST_JSON = os.getenv('FAST_JSON', 'false').lower() in ('1', 'true', 'yes')
+
+
+serialization_settings = SerializationSettings()
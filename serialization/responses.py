@@ -0,0 +1,112 @@
+import functools
+import inspect
+
+from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter
+from pydantic_core import to_json
+from starlette.responses import JSONResponse, Response
+
+from metrics import timed
+from serialization.config import serialization_settings
+
+try:
+    import orjson
+except ImportError:
+    # без orjson сериализует pydantic-core - тоже без промежуточного json.dumps
+    orjson = None
+
+NO_BODY_STATUSES = {204, 304}
+
+
+# Все, что не умеет кодировщик (ORM-объекты и т.п.), проходит через jsonable_encoder - как в обычном пути FastAPI
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_NON_STR_KEYS)
+    return to_json(content, fallback=jsonable_encoder)
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with timed('serialization'):
+            return dumps(content)
+
+
+def _uses_response_param(dependant) -> bool:
+    if dependant.response_param_name is not None:
+        return True
+    return any(_uses_response_param(sub) for sub in dependant.dependencies)
+
+
+# Роут с быстрым путем ответа. Результат эндпоинта один раз проверяется по response_model (если он еще не
+# экземпляр этой модели) и сразу кодируется в байты pydantic-core, без jsonable_encoder и второй валидации.
+# Включается для роутов с response_class=FastJSONResponse; эндпоинты с параметром Response и генераторы
+# идут обычным путем FastAPI.
+class FastJSONRoute(APIRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        endpoint = getattr(endpoint, '__fast_json_endpoint__', endpoint)
+        super().__init__(path, self._wrap(endpoint), **kwargs)
+
+        response_class = getattr(self.response_class, 'value', self.response_class)
+        self.fast_json_supported = not (
+            inspect.isasyncgenfunction(endpoint)
+            or inspect.isgeneratorfunction(endpoint)
+            or _uses_response_param(self.dependant)
+            or (self.status_code or 200) in NO_BODY_STATUSES
+        )
+        self.fast_json = self.fast_json_supported and issubclass(response_class, FastJSONResponse)
+        self._adapter = TypeAdapter(self.response_model) if self.response_model is not None else None
+
+    def _wrap(self, endpoint):
+        if inspect.isasyncgenfunction(endpoint) or inspect.isgeneratorfunction(endpoint):
+            return endpoint
+
+        if inspect.iscoroutinefunction(endpoint):
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                result = await endpoint(*args, **kwargs)
+                return self.render(result) if self.fast_json else result
+        else:
+            @functools.wraps(endpoint)
+            def wrapper(*args, **kwargs):
+                result = endpoint(*args, **kwargs)
+                return self.render(result) if self.fast_json else result
+
+        wrapper.__fast_json_endpoint__ = endpoint
+        return wrapper
+
+    def render(self, result):
+        if isinstance(result, Response):
+            return result
+        with timed('serialization'):
+            if self._adapter is None:
+                body = dumps(result)
+            else:
+                if type(result) is not self.response_model:
+                    result = self._adapter.validate_python(result, from_attributes=True)
+                body = self._adapter.dump_json(
+                    result,
+                    include=self.response_model_include,
+                    exclude=self.response_model_exclude,
+                    by_alias=self.response_model_by_alias,
+                    exclude_unset=self.response_model_exclude_unset,
+                    exclude_defaults=self.response_model_exclude_defaults,
+                    exclude_none=self.response_model_exclude_none,
+                )
+        return Response(body, status_code=self.status_code or 200, media_type='application/json')
+
+
+# Вызывается сразу после создания приложения, до объявления роутов
+def use_fast_json(app: FastAPI, enabled: bool = serialization_settings.FAST_JSON) -> FastAPI:
+    app.router.route_class = FastJSONRoute
+    if enabled:
+        app.router.default_response_class = FastJSONResponse
+    return app
+
+
+# Переключение быстрого пути уже объявленных роутов (для бенчмарков и сравнения ответов)
+def set_fast_json(app: FastAPI, enabled: bool):
+    for route in app.routes:
+        if isinstance(route, FastJSONRoute):
+            route.fast_json = enabled and route.fast_json_supported
@@ -0,0 +1,10 @@
+__all__ = (
+    'ServerSettings',
+    'server_settings',
+    'Supervisor',
+    'default_workers',
+    'size_db_pools',
+)
+
+from server.config import ServerSettings, server_settings
+from server.supervisor import Supervisor, default_workers, size_db_pools
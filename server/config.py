@@ -0,0 +1,25 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+dotenv_path = Path(__file__).parent.parent / '.env'
+
+load_dotenv(dotenv_path=dotenv_path)
+
+
+class ServerSettings:
+    SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.getenv('SERVER_PORT', 8000))
+    # 0 - по числу доступных процессу ядер
+    WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 0))
+    # воркер перезапускается после стольких запросов (+ случайно до JITTER, чтобы не все сразу); 0 - никогда
+    SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', 10_000))
+    SERVER_MAX_REQUESTS_JITTER = int(os.getenv('SERVER_MAX_REQUESTS_JITTER', 1000))
+    # сколько секунд воркер дорабатывает начатые запросы после SIGTERM
+    SERVER_GRACEFUL_TIMEOUT = float(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+    # общее число соединений с БД на все воркеры; делится поровну, без overflow. 0 - настройки DB_POOL_* как есть
+    SERVER_DB_CONNECTIONS = int(os.getenv('SERVER_DB_CONNECTIONS', 0))
+
+
+server_settings = ServerSettings()
@@ -0,0 +1,29 @@
+# Запуск: python -m server.run main:app [--workers 8] [--port 8000] [--db-connections 80]
+import argparse
+import logging
+
+from server.config import server_settings
+from server.supervisor import Supervisor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve one of the apps with N pre-forked uvicorn workers')
+    parser.add_argument('app', help='module:attribute, e.g. main:app, todo_app:app, users_app:app, exceptions.main:app')
+    parser.add_argument('--host', default=server_settings.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=server_settings.SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=server_settings.WEB_CONCURRENCY, help='0 - one per CPU')
+    parser.add_argument('--max-requests', type=int, default=server_settings.SERVER_MAX_REQUESTS)
+    parser.add_argument('--max-requests-jitter', type=int, default=server_settings.SERVER_MAX_REQUESTS_JITTER)
+    parser.add_argument('--graceful-timeout', type=float, default=server_settings.SERVER_GRACEFUL_TIMEOUT)
+    parser.add_argument('--db-connections', type=int, default=server_settings.SERVER_DB_CONNECTIONS,
+                        help='total DB connections for all workers, 0 - use DB_POOL_* per worker')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(process)d | %(levelname)s | %(message)s')
+    Supervisor(args.app, host=args.host, port=args.port, workers=args.workers, max_requests=args.max_requests,
+               max_requests_jitter=args.max_requests_jitter, graceful_timeout=args.graceful_timeout,
+               db_connections=args.db_connections).run()
+
+
+if __name__ == '__main__':
+    main()
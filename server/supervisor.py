@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import random
+import signal
+import sys
+import time
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+from server.config import server_settings
+
+logger = logging.getLogger('server')
+
+# воркер, упавший быстрее этого, перезапускается с паузой - чтобы не крутить цикл падений
+MIN_WORKER_UPTIME = 1.0
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+def default_workers() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+# Размер пула на воркер задается через окружение до импорта приложения: DB_Settings читается при импорте db.config
+def size_db_pools(workers: int, connections: int):
+    if connections <= 0:
+        return
+    os.environ['DB_POOL_SIZE'] = str(max(1, connections // workers))
+    os.environ['DB_MAX_OVERFLOW'] = '0'
+
+
+# Pre-fork супервизор: приложение (вместе с политикой RBAC и ключами JWT) импортируется один раз в родителе,
+# там же выполняется его app.state.prepare (создание таблиц, сиды); воркеры получают все через fork
+# и делят память copy-on-write, слушая общий сокет. Приложение с app.state.process_local_state
+# (состояние аутентификации в памяти процесса) запускается только в одном воркере.
+# Упавшие и отработавшие max_requests воркеры заменяются новыми; SIGTERM/SIGINT - плавная остановка всех.
+class Supervisor:
+    def __init__(self, app: str, host: str = server_settings.SERVER_HOST, port: int = server_settings.SERVER_PORT,
+                 workers: int = server_settings.WEB_CONCURRENCY,
+                 max_requests: int = server_settings.SERVER_MAX_REQUESTS,
+                 max_requests_jitter: int = server_settings.SERVER_MAX_REQUESTS_JITTER,
+                 graceful_timeout: float = server_settings.SERVER_GRACEFUL_TIMEOUT,
+                 db_connections: int = server_settings.SERVER_DB_CONNECTIONS):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError('Multi-process mode requires os.fork (Linux/macOS)')
+        self.app_path = app
+        self.host = host
+        self.port = port
+        self.workers = workers or default_workers()
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.db_connections = db_connections
+        self.children: dict[int, float] = {}
+        self.stopping = False
+
+    def run(self):
+        size_db_pools(self.workers, self.db_connections)
+        self.app = import_from_string(self.app_path)
+        state = getattr(self.app, 'state', None)
+        process_local_state = getattr(state, 'process_local_state', None)
+        if self.workers > 1 and process_local_state:
+            raise RuntimeError(f'{self.app_path} keeps {", ".join(process_local_state)} in process memory: '
+                               f'set it to redis to share state between workers or run with --workers 1')
+        prepare = getattr(state, 'prepare', None)
+        if prepare is not None:
+            asyncio.run(self._prepare(prepare))
+        self.config = uvicorn.Config(self.app, host=self.host, port=self.port,
+                                     timeout_graceful_shutdown=self.graceful_timeout)
+        self.socket = self.config.bind_socket()
+
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, self._handle_stop)
+        logger.info('Starting %s workers for %s on %s:%s', self.workers, self.app_path, self.host, self.port)
+        for _ in range(self.workers):
+            self._spawn()
+        self._supervise()
+        self.socket.close()
+
+    # одноразовая подготовка приложения (таблицы, сиды) до fork; соединения, открытые для нее, закрываются
+    # вместе с event loop, воркеры открывают свои
+    async def _prepare(self, prepare):
+        try:
+            await prepare()
+        finally:
+            if 'db.config' in sys.modules:
+                await sys.modules['db.config'].dispose_engines()
+
+    def _spawn(self):
+        # сигналы блокируются на время fork, чтобы воркер не успел выполнить обработчик родителя
+        signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+            return
+        try:
+            self._run_worker()
+        except BaseException:
+            logger.exception('Worker crashed')
+            os._exit(1)
+        os._exit(0)
+
+    def _run_worker(self):
+        for signum in STOP_SIGNALS:
+            signal.signal(signum, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        # соединения, открытые в родителе, в воркере использовать нельзя - пул создается заново
+        if 'db.config' in sys.modules:
+            sys.modules['db.config'].reset_pools_after_fork()
+        self.config.limit_max_requests = None
+        if self.max_requests > 0:
+            self.config.limit_max_requests = self.max_requests + random.randint(0, self.max_requests_jitter)
+        uvicorn.Server(self.config).run(sockets=[self.socket])
+
+    def _handle_stop(self, signum, frame):
+        if self.stopping:
+            return
+        self.stopping = True
+        self.deadline = time.monotonic() + self.graceful_timeout + 5
+        logger.info('Stopping workers')
+        for pid in self.children:
+            self._kill(pid, signal.SIGTERM)
+
+    def _kill(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _supervise(self):
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                if self.stopping and time.monotonic() > self.deadline:
+                    for child in self.children:
+                        self._kill(child, signal.SIGKILL)
+                time.sleep(0.1)
+                continue
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            logger.info('Worker %s exited with code %s, starting a new one', pid, code)
+            if time.monotonic() - started < MIN_WORKER_UPTIME:
+                time.sleep(MIN_WORKER_UPTIME)
+            if not self.stopping:
+                self._spawn()
@@ -0,0 +1,35 @@
+import asyncio
+import time
+
+from auth.revocation import RevocationList
+
+
+def test_evicted_token_stays_revoked_until_exp():
+    revoked = RevocationList(capacity=3)
+    now = time.time()
+
+    async def scenario():
+        for i in range(4):
+            await revoked.revoke(f'j{i}', now + 60 + i)
+        return [await revoked.is_revoked(f'j{i}') for i in range(4)], await revoked.is_revoked('never-revoked')
+
+    states, unknown = asyncio.run(scenario())
+
+    # j0 вытеснен из словаря при переполнении, но его exp еще не наступил
+    assert states == [True, True, True, True]
+    assert unknown is False
+    assert len(revoked) == 3
+    assert revoked.stats()['evicted'] == 1
+
+
+def test_evicted_token_is_released_after_exp():
+    revoked = RevocationList(capacity=1)
+    now = time.time()
+
+    async def scenario():
+        await revoked.revoke('old', now + 60)
+        await revoked.revoke('new', now + 120)
+        revoked._overflow_until = now - 1  # вытесненная запись истекла
+        return await revoked.is_revoked('old'), await revoked.is_revoked('new')
+
+    assert asyncio.run(scenario()) == (False, True)
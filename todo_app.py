@@ -1,16 +1,36 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import Annotated, Literal
+
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, Header, HTTPException, Query
 from fastapi.exceptions import RequestValidationError
-from starlette.responses import Response, JSONResponse
+from starlette.responses import Response, StreamingResponse
 
-from db.config import TodoTools
-from pydantic_models import TodoPayload, Todo
+from exceptions import LogSampler, validation_errors_response
+from db.config import AsyncTodoTools, TodoTools, decode_todo_cursor, dispose_engines, pool_statistics
+from metrics import InstrumentedJSONResponse, instrument, registry
+from pydantic_models import TodoPayload, Todo, TodoPage, TodoBulkUpdate, BulkItemResult
+from serialization import use_fast_json
 
 # LOGGING
 # logging.basicConfig(level=logging.DEBUG, format='%(asctime)s | %(levelname)s | %(message)s')
 
 # APP
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await dispose_engines()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=InstrumentedJSONResponse)
+instrument(app)
+use_fast_json(app)
+registry.register_collector('todo_cache', AsyncTodoTools.cache.stats)
+registry.register_collector('todo_loader', AsyncTodoTools.loader.stats)
+
+logger = logging.getLogger(__name__)
+log_sampler = LogSampler(logger, per_second=1)
 
 
 # @app.exception_handler(HTTPException)
@@ -20,67 +40,123 @@ app = FastAPI()
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
-    errors = []
-    print(exc.errors())
-    for error in exc.errors():
-        errors.append(
-            {
-                "field": error["loc"][-1],
-                "msg": error['msg'],
-                "value": error["input"]
-            }
-        )
-
-    return JSONResponse(status_code=400, content=errors)
+    errors = exc.errors()
+    log_sampler.log(logging.DEBUG, 'validation_error', 'Validation error: %s', errors)
+    return validation_errors_response(
+        [{"field": error["loc"][-1], "msg": error['msg'], "value": error["input"]} for error in errors],
+        status_code=400,
+    )
 
 
 # ROUTES
+IdempotencyKey = Annotated[str | None, Header(max_length=64)]
+
+
+# с заголовком Idempotency-Key повтор запроса (например, после таймаута) вернет ту же задачу, а не создаст новую
 @app.post('/todo', response_model=Todo)
-async def create_todo(todo_data: TodoPayload):
-    todo = TodoTools.add_todo(todo_data)
+async def create_todo(todo_data: TodoPayload, idempotency_key: IdempotencyKey = None):
+    if idempotency_key is not None:
+        todo = await AsyncTodoTools.upsert_todo(todo_data, idempotency_key=idempotency_key)
+    else:
+        todo = await AsyncTodoTools.add_todo(todo_data)
 
     # return {'msg': 'todo has been added'}
     # return {'msg': f'Todo with id {todo.id} been added'}
     return todo
 
 
-@app.get('/todo_list')
-async def get_all_todo():
-    todo = TodoTools.get_all_todos()
+TODO_PAGE_MAX_LIMIT = 1000
+TODO_BULK_MAX_ITEMS = 50_000
+
+
+def check_bulk_size(items: list):
+    if len(items) > TODO_BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f'Too many items in batch, max is {TODO_BULK_MAX_ITEMS}')
+
+
+# BULK ROUTES
+@app.post('/todo/bulk', response_model=list[BulkItemResult])
+async def create_todos_bulk(todos: list[TodoPayload]):
+    check_bulk_size(todos)
+    return await AsyncTodoTools.add_todos(todos)
 
-    return todo
+
+@app.put('/todo/bulk', response_model=list[BulkItemResult])
+async def update_todos_bulk(todos: list[TodoBulkUpdate]):
+    check_bulk_size(todos)
+    return await AsyncTodoTools.update_todos(todos)
+
+
+@app.delete('/todo/bulk', response_model=list[BulkItemResult])
+async def delete_todos_bulk(pks: list[int] = Body()):
+    check_bulk_size(pks)
+    return await AsyncTodoTools.delete_todos(pks)
+
+
+# фильтры выполняются в БД по индексам: completed, префикс title, полнотекстовый поиск q по title и description
+@app.get('/todo_list', response_model=TodoPage)
+async def get_all_todo(after: str | None = None, limit: int = Query(default=100, ge=1, le=TODO_PAGE_MAX_LIMIT),
+                       completed: bool | None = None,
+                       title_prefix: str | None = Query(default=None, min_length=1, max_length=50),
+                       q: str | None = Query(default=None, min_length=1, max_length=200),
+                       sort: Literal['id', '-id', 'title', '-title'] = 'id'):
+    try:
+        cursor = decode_todo_cursor(sort, after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+    todos, next_cursor = await AsyncTodoTools.get_todos_page(after=cursor, limit=limit, sort=sort, completed=completed,
+                                                             title_prefix=title_prefix, search=q)
+
+    return TodoPage(items=todos, next_cursor=next_cursor)
+
+
+# весь список построчно в формате NDJSON - память не растет с размером таблицы
+@app.get('/todo_list/stream')
+async def stream_all_todo(after: int | None = None):
+    async def ndjson_lines():
+        async for todo in AsyncTodoTools.stream_todos(after=after):
+            yield Todo.model_validate(todo).model_dump_json() + '\n'
+
+    return StreamingResponse(ndjson_lines(), media_type='application/x-ndjson')
 
 
 @app.get('/delete')
 async def delete_todo(pk: int):
-    todo = TodoTools.delete_todo_by_id(pk)
+    todo = await AsyncTodoTools.delete_todo_by_id(pk)
 
     return todo
 
 
 @app.put('/update')
 async def update_todo(pk: int, todo_data: TodoPayload):
-    todo = TodoTools.update_todo(pk, todo_data)
+    todo = await AsyncTodoTools.update_todo(pk, todo_data)
 
     return todo
 
 
+@app.get('/pool_stats')
+async def get_pool_stats():
+    return pool_statistics()
+
+
+@app.get('/cache_stats')
+async def get_cache_stats():
+    return {**AsyncTodoTools.cache.stats(), 'loader': AsyncTodoTools.loader.stats()}
+
+
 todos = {"foo": "Listen to the Bar Fighters"}
 
 
-@app.put("/get-or-create-todo/{pk}", status_code=200)
-def get_or_create_todo(pk: int, todo_payload: TodoPayload, response: Response):
-    todo = TodoTools.get_todo(pk=pk)
-    if not todo:
-        todo = TodoTools.add_todo(todo_payload)
-        return todo
-    return todo
+# один INSERT ... ON CONFLICT: существующая задача возвращается как есть, новая создается именно с этим pk
+@app.put("/get-or-create-todo/{pk}", status_code=200, response_model=Todo)
+async def get_or_create_todo(pk: int, todo_payload: TodoPayload, idempotency_key: IdempotencyKey = None):
+    return await AsyncTodoTools.upsert_todo(todo_payload, pk=pk, idempotency_key=idempotency_key)
 
 
 @app.get("/todos-header/{pk}")
 # async def read_todo_header(pk: int, x_error: Annotated[str | None, Header()] = None):
 async def read_todo_header(pk: int, response: Response):
-    todo = TodoTools.get_todo(pk)
+    todo = await AsyncTodoTools.get_todo_cached(pk)
     if todo:
         response.headers['User-Agent'] = 'ABOBA'
         return {'todo': todo}
@@ -1,28 +1,33 @@
+import logging
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Annotated, Optional
 
 import uvicorn
-from databases import Database
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, FastAPI, HTTPException, Query
 from pydantic import BaseModel
 
-from db.config import settings
+from db.config import dispose_engines, pool_statistics
+from db.users import AsyncUserTools
+from metrics import InstrumentedJSONResponse, instrument, registry
+from pydantic_models import BulkItemResult
+from serialization import use_fast_json
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await database.connect()
     yield
-    await database.disconnect()
+    await dispose_engines()
 
 
-app = FastAPI(lifespan=lifespan)
-
-# EXCEPTION HANDLERS
+app = FastAPI(lifespan=lifespan, default_response_class=InstrumentedJSONResponse)
+instrument(app)
+use_fast_json(app)
+registry.register_collector('user_cache', AsyncUserTools.cache.stats)
+registry.register_collector('user_loader', AsyncUserTools.loader.stats)
 
+logger = logging.getLogger(__name__)
 
-# URL для PostgreSQL
-database = Database(settings.DB_URL)
+# EXCEPTION HANDLERS
 
 
 # Модель User для валидации входных данных
@@ -41,25 +46,41 @@ class UserReturn(BaseModel):
 
 @app.post('/users', response_model=UserReturn)
 async def create_user(user: UserCreate):
-    query = 'INSERT INTO users (username, email) VALUES (:username, :email) RETURNING id'
-    values = {'username': user.username, 'email': user.email}
     try:
-        user_id = await database.execute(query=query, values=values)
-        return {**user.model_dump(), 'id': user_id}
+        created = await AsyncUserTools.add_user(username=user.username, email=user.email)
+        return {**user.model_dump(), 'id': created['id']}
     except Exception as e:
-        print(e)
+        logger.exception('Failed to create user')
         raise HTTPException(status_code=500, detail='Failed to create user')
 
 
-@app.get('/users', response_model=UserReturn)
-async def get_user(user_id: int):
-    query = 'SELECT * FROM users WHERE id = :user_id'
-    values = {'user_id': user_id}
+USERS_BATCH_MAX_ITEMS = 10_000
+USERS_MULTI_GET_MAX_IDS = 1000
+
+
+# много пользователей за один запрос: многострочный INSERT чанками, результат по каждому элементу в порядке входа
+@app.post('/users/batch', response_model=list[BulkItemResult])
+async def create_users(users: Annotated[list[UserCreate], Body(max_length=USERS_BATCH_MAX_ITEMS)]):
+    return await AsyncUserTools.add_users([user.model_dump() for user in users])
+
+
+# /users?user_id=1 - один пользователь, /users?ids=1&ids=2 - список одним запросом к БД
+@app.get('/users', response_model=UserReturn | list[UserReturn])
+async def get_user(user_id: int | None = None,
+                   ids: Annotated[list[int] | None, Query(max_length=USERS_MULTI_GET_MAX_IDS)] = None):
     # if user_id == 40:
     #     raise Exception('User with id 40 does not exist')
+    if ids is not None:
+        try:
+            users = await AsyncUserTools.get_by_ids(ids)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail='Failed to fetch users from db')
+        return [UserReturn(username=user['username'], email=user['email'], id=user['id']) for user in users]
+    if user_id is None:
+        raise HTTPException(status_code=422, detail='user_id or ids is required')
 
     try:
-        result = await database.fetch_one(query=query, values=values)
+        result = await AsyncUserTools.get_by_id(user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail='Failed to fetch user from db')
 
@@ -71,31 +92,38 @@ async def get_user(user_id: int):
 
 @app.put('/user/{user_id}', response_model=UserReturn)
 async def update_user(user_id: int, user: UserCreate):
-    query = 'UPDATE users SET username = :username, email = :email WHERE id = :user_id'
-    values = {'user_id': user_id, 'username': user.username, 'email': user.email}
-
     try:
-        await database.execute(query=query, values=values)
-        return {**user.model_dump(), 'id': user_id}
+        updated = await AsyncUserTools.update_user(user_id, username=user.username, email=user.email)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to update user in database")
 
+    if updated is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {**user.model_dump(), 'id': user_id}
 
-@app.delete('/user/{user_id}', response_model=UserReturn)
-async def delete_user(user_id: int, user: UserCreate):
-    query = "DELETE FROM users WHERE user_id= :user_id"
-    values = {'user_id': user_id}
 
+@app.delete('/user/{user_id}')
+async def delete_user(user_id: int):
     try:
-        deleted_rows = await database.execute(query=query, values=values)
+        deleted = await AsyncUserTools.delete_user(user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Failed to delete user in database")
 
-    if deleted_rows:
+    if deleted:
         return {'message': "User deleted succesfully"}
     else:
         raise HTTPException(status_code=404, detail="User not found")
 
 
+@app.get('/pool_stats')
+async def get_pool_stats():
+    return pool_statistics()
+
+
+@app.get('/cache_stats')
+async def get_cache_stats():
+    return {**AsyncUserTools.cache.stats(), 'loader': AsyncUserTools.loader.stats()}
+
+
 if __name__ == '__main__':
     uvicorn.run('users_app:app', reload=True)